@@ -2,10 +2,10 @@
 
 # Imports
 import os
-from scripts.config import Config
+from scripts.config import Config, get_config
 
-# Initialize the Config object
-config = Config()
+# The shared Config object
+config = get_config()
 
 def load_settings():
     config.load_config()
@@ -53,15 +53,13 @@ def handle_llm_model_settings():
             break
         elif choice == '1':  # model_path option
             new_model_path = clean_input("Enter new model path: ").strip()
-            config.llm_model_settings['model_path'] = new_model_path
-            save_settings()
+            config.set('model_path', new_model_path, save=True)
         elif choice == '2':  # chat_llm_model option
             model_path = config.llm_model_settings['model_path']
             if os.path.isdir(model_path):
                 selected_model = select_model_file(model_path)
                 if selected_model:
-                    config.llm_model_settings['chat_llm_model'] = selected_model
-                    save_settings()
+                    config.set('chat_llm_model', selected_model, save=True)
             else:
                 print(f"Invalid model path: {model_path}")
         elif choice == '3':  # code_llm_model option
@@ -69,28 +67,24 @@ def handle_llm_model_settings():
             if os.path.isdir(model_path):
                 selected_model = select_model_file(model_path)
                 if selected_model:
-                    config.llm_model_settings['code_llm_model'] = selected_model
-                    save_settings()
+                    config.set('code_llm_model', selected_model, save=True)
             else:
                 print(f"Invalid model path: {model_path}")
         else:
             print("Invalid choice. Please select a valid option.")
 
+OPTIONAL_MODES = ['continuous_mode', 'debug_mode', 'speak_mode', 'fast_console']
+
 def handle_optional_modes():
     while True:
-        choice = display_menu("Auto-CPP-Local - Optional Modes", config.program_settings)
+        modes = {key: config.get(key) for key in OPTIONAL_MODES}
+        choice = display_menu("Auto-CPP-Local - Optional Modes", modes)
         
         if choice == 'B':
             break
-        elif choice == '1':  # continuous_mode
-            config.program_settings['continuous_mode'] = not config.program_settings['continuous_mode']
-            save_settings()
-        elif choice == '2':  # debug_mode
-            config.program_settings['debug_mode'] = not config.program_settings['debug_mode']
-            save_settings()
-        elif choice == '3':  # speak_mode
-            config.system_settings['speak_mode'] = not config.system_settings['speak_mode']
-            save_settings()
+        elif choice.isdigit() and 1 <= int(choice) <= len(OPTIONAL_MODES):
+            key = OPTIONAL_MODES[int(choice) - 1]
+            config.set(key, not config.get_bool(key), save=True)
         else:
             print("Invalid choice. Please select a valid option.")
 
@@ -108,11 +102,13 @@ def handle_submenu_selection(settings_group_name):
             elif choice.isdigit() and 1 <= int(choice) <= len(settings_group):
                 selected_key = list(settings_group.keys())[int(choice) - 1]
                 new_value = clean_input(f"Enter new value for {selected_key}: ").strip()
-                settings_group[selected_key] = new_value
-                save_settings()  # Save after each change
+                config.set(selected_key, Config.parse_value(new_value), save=True)  # Save after each change
             else:
                 print("Invalid choice. Please select a valid option.")
 
+MENU_GROUPS = {"1": "program_settings", "2": "session_settings", "3": "system_settings",
+               "4": "llm_model_settings", "5": "browsing_settings", "6": "optional_modes"}
+
 def main_menu():
     load_settings()
     
@@ -123,10 +119,22 @@ def main_menu():
             "3": "System Settings",
             "4": "LLM Model Settings",
             "5": "Browsing Settings",
-            "6": "Optional Modes"
+            "6": "Optional Modes",
+            "7": "Profile Imports",
+            "8": "Trace Report"
         })
-        if choice in ['1', '2', '3', '4', '5', '6']:
-            handle_submenu_selection(f"{choice}_settings")
+        if choice in MENU_GROUPS:
+            handle_submenu_selection(MENU_GROUPS[choice])
+        elif choice == '7':
+            from scripts.benchmarks import profile_imports
+            profile_imports()
+        elif choice == '8':
+            from scripts.tracing import find_traces, print_report
+            paths = find_traces()
+            if paths:
+                print_report(paths)
+            else:
+                print("No traces yet, they are written to .\\logs\\traces during a run.")
         elif choice == 'B':
             begin_autocpp_lite()
             break
@@ -148,7 +156,7 @@ def exit_and_save():
     print("Settings Saved To Yaml.")
 
 # Import clean_input here to ensure it is available when needed
-from scripts.utilities_one import clean_input
+from scripts.utilities_two import clean_input
 
 if __name__ == "__main__":
     main_menu()
\ No newline at end of file
@@ -0,0 +1,424 @@
+# `.\scripts\benchmarks.py` - Benchmarks, run with `python -m scripts.benchmarks <name> [--save-baseline FILE | --baseline FILE]`.
+
+# Imports
+import argparse, contextlib, glob, http.server, json, logging, os, random, subprocess, sys, tempfile, threading, time, tracemalloc
+import numpy as np
+import requests
+from scripts.prompt import HistoryTokenIndex, create_chat_message, select_within_budget
+from scripts.memory import EmbeddingBuffer, ExactIndex, IVFFlatIndex, HNSWLibIndex, FaissIndex, top_k
+from scripts.pagecache import PageCache
+from scripts.config import get_config
+from scripts.utilities_two import Logger
+from scripts.standin import StandInServer, scripted_replies, write_stand_in_gguf
+from scripts.chunking import chunk_lines
+from scripts.ingestion import iter_file_lines
+
+# Globals
+WORDS = "the agent reads files writes code runs tests and browses pages to plan next steps".split()
+
+# Functions
+def synthetic_history(num_messages, seed=0):
+    rng = random.Random(seed)
+    roles = ["user", "assistant", "system"]
+    return [create_chat_message(roles[i % 3], " ".join(rng.choices(WORDS, k=rng.randint(5, 400)))) for i in range(num_messages)]
+
+def approx_token_counts(messages):
+    return [len(msg["content"]) // 4 + 1 for msg in messages]
+
+def legacy_history_walk(full_message_history, token_budget):
+    """The pre-budgeter loop: walk back from the newest message, re-counting each one."""
+    used, index = 0, len(full_message_history) - 1
+    while index >= 0:
+        tokens_to_add = approx_token_counts([full_message_history[index]])[0]
+        if used + tokens_to_add > token_budget:
+            break
+        used += tokens_to_add
+        index -= 1
+    return index + 1, used
+
+def bench_context_assembly(sizes=(1000, 10000), steps=500, token_budget=6000):
+    print(f"{'messages':>10} {'cold ms':>10} {'step us':>10} {'legacy step us':>15} {'kept':>6}")
+    for size in sizes:
+        history = synthetic_history(size)
+        extra = synthetic_history(steps, seed=1)
+        index = HistoryTokenIndex(count_fn=approx_token_counts)
+
+        start = time.perf_counter()
+        index.update(history)
+        kept_start, _ = index.newest_within(token_budget)
+        cold_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for message in extra:
+            history.append(message)
+            index.update(history)
+            kept_start, _ = index.newest_within(token_budget)
+            select_within_budget(approx_token_counts(extra[:10]), 2500)
+        step_us = (time.perf_counter() - start) / steps * 1e6
+
+        start = time.perf_counter()
+        for _ in range(steps):
+            legacy_start, _ = legacy_history_walk(history, token_budget)
+        legacy_us = (time.perf_counter() - start) / steps * 1e6
+
+        assert legacy_start == kept_start, "budgeter and legacy walk disagree"
+        print(f"{size:>10} {cold_ms:>10.2f} {step_us:>10.1f} {legacy_us:>15.1f} {len(history) - kept_start:>6}")
+
+def bench_embedding_growth(sizes=(10000, 100000), dim=256, legacy_limit=20000):
+    print(f"{'rows':>10} {'buffer adds/s':>15} {'concatenate adds/s':>20}")
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        rows = rng.standard_normal((size, dim), dtype=np.float32)
+
+        buffer = EmbeddingBuffer(dim)
+        start = time.perf_counter()
+        for i in range(size):
+            buffer.append(rows[i:i + 1])
+        buffer_rate = size / (time.perf_counter() - start)
+
+        legacy_rate = "-"
+        if size <= legacy_limit:
+            embeddings = np.zeros((0, dim), np.float32)
+            start = time.perf_counter()
+            for i in range(size):
+                embeddings = np.concatenate([embeddings, rows[i:i + 1]], axis=0)
+            legacy_rate = f"{size / (time.perf_counter() - start):.0f}"
+
+        assert np.array_equal(buffer.view(), rows)
+        print(f"{size:>10} {buffer_rate:>15.0f} {legacy_rate:>20}")
+
+def clustered_embeddings(num_rows, dim, num_clusters=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim), dtype=np.float32)
+    rows = centers[rng.integers(num_clusters, size=num_rows)] + 0.5 * rng.standard_normal((num_rows, dim), dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def bench_memory_index(num_rows=50000, dim=256, num_queries=200, k=10):
+    rows = clustered_embeddings(num_rows + num_queries, dim)
+    rows, queries = rows[:num_rows], rows[num_rows:]
+    buffer = EmbeddingBuffer(dim, rows)
+    exact = ExactIndex(buffer)
+    truth = [set(exact.search(query, k).tolist()) for query in queries]
+
+    candidates = [("local", lambda: ExactIndex(buffer))]
+    candidates += [(f"local_ivf nprobe={nprobe}", lambda nprobe=nprobe: IVFFlatIndex(buffer, nprobe=nprobe)) for nprobe in (1, 4, 8, 16, 32)]
+    candidates += [(f"local_hnsw ef={ef}", lambda ef=ef: HNSWLibIndex(buffer, ef=ef)) for ef in (16, 64, 256)]
+    candidates += [(f"local_faiss ef={ef}", lambda ef=ef: FaissIndex(buffer, ef=ef)) for ef in (16, 64, 256)]
+
+    print(f"{'index':>24} {'build s':>8} {'query ms':>9} {'recall@' + str(k):>10}")
+    for name, factory in candidates:
+        try:
+            start = time.perf_counter()
+            index = factory()
+            index.add(list(range(num_rows)), rows)
+            build_s = time.perf_counter() - start
+        except ImportError as e:
+            print(f"{name:>24} skipped ({e})")
+            continue
+        start = time.perf_counter()
+        results = [index.search(query, k) for query in queries]
+        query_ms = (time.perf_counter() - start) / num_queries * 1000
+        recall = sum(len(truth[i] & set(result.tolist())) for i, result in enumerate(results)) / (k * num_queries)
+        print(f"{name:>24} {build_s:>8.2f} {query_ms:>9.3f} {recall:>10.3f}")
+
+def bench_quantization(num_rows=50000, dim=1024, num_queries=100, k=10, rerank=4):
+    rows = clustered_embeddings(num_rows + num_queries, dim)
+    rows, queries = rows[:num_rows], rows[num_rows:]
+    truth = [set(top_k(rows @ query, k).tolist()) for query in queries]
+
+    print(f"{'mode':>8} {'RAM MB':>8} {'disk MB':>8} {'query ms':>9} {'subset ms':>10} {'recall@' + str(k):>10} {'reranked':>9}")
+    disk_mb = rows.nbytes / 2**20  # The store keeps float32 rows on disk in every mode
+    subsets = [np.sort(np.random.default_rng(i).choice(num_rows, num_rows // 20, replace=False)) for i in range(num_queries)]
+    for quantization in ('none', 'float16', 'int8'):
+        buffer = EmbeddingBuffer(dim, rows, quantization=quantization)
+        index = ExactIndex(buffer)
+        start = time.perf_counter()
+        results = [index.search(query, k) for query in queries]
+        query_ms = (time.perf_counter() - start) / num_queries * 1000
+        start = time.perf_counter()
+        for query, subset in zip(queries, subsets):
+            buffer.scores(query, subset)
+        subset_ms = (time.perf_counter() - start) / num_queries * 1000
+        reranked = []
+        for query in queries:
+            candidates = index.search(query, k * rerank)
+            reranked.append(candidates[top_k(rows[candidates] @ query, k)])
+        recall = sum(len(truth[i] & set(result.tolist())) for i, result in enumerate(results)) / (k * num_queries)
+        reranked_recall = sum(len(truth[i] & set(result.tolist())) for i, result in enumerate(reranked)) / (k * num_queries)
+        print(f"{quantization:>8} {buffer.nbytes / 2**20:>8.1f} {disk_mb:>8.1f} {query_ms:>9.3f} {subset_ms:>10.3f} {recall:>10.3f} {reranked_recall:>9.3f}")
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Local stand-in for a web server: slow pages with ETags that honour If-None-Match."""
+    delay = 0.05
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        etag = f'"{self.path}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"<html><body><p>Page {self.path}</p><a href='{self.path}/next'>next</a></body></html>".encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def load_stand_in(url, headers):
+    response = requests.get(url, headers=headers, timeout=10)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    return {"text": response.text, "links": [], "etag": response.headers.get("ETag")}
+
+def bench_page_cache(num_pages=50):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_address[1]}/page{i}" for i in range(num_pages)]
+    with tempfile.TemporaryDirectory() as folder:
+        cache = PageCache(os.path.join(folder, "pages.sqlite3"), ttl=3600)
+        print(f"{'pass':>12} {'ms/page':>9}  stats")
+        for name in ("cold", "fresh", "revalidate", "server down", "offline"):
+            cache.ttl = 3600 if name in ("cold", "fresh") else 0
+            cache.offline = name == "offline"
+            if name == "server down":
+                server.shutdown()
+                server.server_close()
+            start = time.perf_counter()
+            pages = [cache.get(url, lambda headers, url=url: load_stand_in(url, headers)) for url in urls]
+            page_ms = (time.perf_counter() - start) / num_pages * 1000
+            assert all(f"Page /page{i}" in page["text"] for i, page in enumerate(pages))
+            print(f"{name:>12} {page_ms:>9.2f}  {cache.get_stats()}")
+        cache.conn.close()
+
+def bench_streaming_ingest(num_lines=200000, max_tokens=500):
+    """Chunk large files without blank lines as ingestion streams them: read before the first chunk, and peak memory."""
+    print(f"{'file':>10} {'MB':>6} {'read before 1st chunk':>22} {'chunks':>7} {'chunks/s':>9} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        log_file, minified_file = os.path.join(folder, "server.log"), os.path.join(folder, "bundle.min.js")
+        with open(log_file, "w", encoding="utf-8", newline="") as f:
+            for i in range(num_lines):
+                f.write(f"2026-10-18 12:{i // 60 % 60:02d}:{i % 60:02d} INFO worker-{i % 7} {' '.join(WORDS[i % 5:i % 5 + 6])} {i}\n")
+        with open(minified_file, "w", encoding="utf-8", newline="") as f:
+            f.write("".join(f"var {WORDS[i % len(WORDS)]}{i}=function(a){{return a+{i}}};" for i in range(num_lines)))
+        for name, path in (("log", log_file), ("minified", minified_file)):
+            size, read = os.path.getsize(path), 0
+            def counted_lines():
+                nonlocal read
+                for line in iter_file_lines(path):
+                    read += len(line)
+                    yield line
+            tracemalloc.start()
+            start = time.perf_counter()
+            chunks = chunk_lines(counted_lines(), max_tokens, 50, lambda text: len(text) // 4)
+            next(chunks)
+            read_first = read
+            num_chunks = 1 + sum(1 for _ in chunks)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert read_first < size // 100, f"{name}: {read_first} of {size} characters read before the first chunk"
+            print(f"{name:>10} {size / 2**20:>6.1f} {read_first / size:>21.3%} {num_chunks:>7} {num_chunks / elapsed:>9.0f} {peak / 2**20:>8.2f}")
+
+def bench_console_logging(steps=5, lines_per_step=4):
+    """Agent-thread time per step spent logging, typed out in line versus handed to the log queue."""
+    cfg = get_config()
+    fast_console = cfg.get_bool('fast_console')
+    results = []
+    with tempfile.TemporaryDirectory() as folder, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, queued, fast in (("typed", False, False), ("queued", True, False), ("fast", True, True)):
+            cfg.set('fast_console', fast)
+            log = Logger(os.path.join(folder, name), queued=queued)
+            start = time.perf_counter()
+            for step in range(steps):
+                for line in range(lines_per_step):
+                    log.typewriter_log("THOUGHTS:", "", " ".join(WORDS[:10]) + f" step {step} line {line}")
+            step_ms = (time.perf_counter() - start) / steps * 1000
+            start = time.perf_counter()
+            log.flush()
+            results.append((name, step_ms, (time.perf_counter() - start) * 1000))
+            log.close()
+    cfg.set('fast_console', fast_console)
+    print(f"{'console':>8} {'ms/step':>9} {'drain ms':>9}")
+    for name, step_ms, drain_ms in results:
+        print(f"{name:>8} {step_ms:>9.2f} {drain_ms:>9.1f}")
+    print(f"saved per step by queueing: {results[0][1] - results[1][1]:.1f} ms")
+
+@contextlib.contextmanager
+def stand_in_environment(folder, settings):
+    """Run with the working directory, config, chat model, embedding cache and traces pointed at a stand-in in folder."""
+    from scripts import models, tracing, utilities_one
+    from scripts.memory import EmbeddingCache
+    cfg = get_config()
+    model_file = os.path.join(folder, "models", "DeepSeek-V2-Lite-Chat-Q4_K_M-stand-in.gguf")
+    os.makedirs(os.path.dirname(model_file))
+    write_stand_in_gguf(model_file)
+    settings = {'model_path': os.path.dirname(model_file), 'memory_backend': 'local', 'memory_quantization': 'none', 'embed_dim': 64,
+                'debug_mode': False, 'speak_mode': False, 'fast_console': True, 'trace_enabled': True, **settings}
+    saved = {key: cfg.get(key) for key in settings}
+    saved_cache, saved_writer, cwd = utilities_one.embedding_cache, tracing.trace_writer, os.getcwd()
+    server = StandInServer('chat', model_file, scripted_replies(), settings['embed_dim'])
+    try:
+        os.chdir(folder)
+        for key, value in settings.items():
+            cfg.set(key, value)
+        models.get_chat_token_counter.cache_clear()
+        models.model_servers['chat'] = models.model_servers['embed'] = server
+        utilities_one.embedding_cache = EmbeddingCache(os.path.join(folder, "embeddings.sqlite3"))
+        tracing.trace_writer = tracing.TraceWriter(os.path.join(folder, "traces"))
+        yield server
+    finally:
+        tracing.trace_writer.close()
+        utilities_one.embedding_cache.close()
+        tracing.trace_writer, utilities_one.embedding_cache = saved_writer, saved_cache
+        models.model_servers.pop('chat', None)
+        models.model_servers.pop('embed', None)
+        models.get_chat_token_counter.cache_clear()
+        for key, value in saved.items():
+            cfg.set(key, value)
+        os.chdir(cwd)
+
+def bench_agent(steps=20, num_files=20, words_per_file=2000, num_queries=50):
+    """Ingestion, memory retrieval and agent steps end to end on the stand-in model; returns metrics for baselines."""
+    from scripts.engine import Agent
+    from scripts.ingestion import ingest_files
+    from scripts.prompt import get_prompt
+    from scripts.tracing import percentile, read_traces, summarize
+    from scripts.utilities_one import LocalCache, logger
+    cfg = get_config()
+    rng = random.Random(0)
+    metrics = {}
+    logger.set_level(logging.INFO)
+    with tempfile.TemporaryDirectory() as folder:
+        # ingest_stream_mb 0 streams every file in this process, where the stand-in config applies
+        settings = {'memory_index': os.path.join(folder, "memory"), 'ingest_stream_mb': 0, 'continuous_mode': True, 'continuous_limit': steps}
+        with stand_in_environment(folder, settings) as server, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            files = []
+            for i in range(num_files):
+                path = os.path.join(folder, "docs", f"doc{i}.txt")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("\n\n".join(" ".join(rng.choices(WORDS, k=100)) for _ in range(words_per_file // 100)))
+                files.append((path, os.path.relpath(path, folder)))
+
+            memory = LocalCache(cfg)
+            start = time.perf_counter()
+            ingest_files(files, memory, scope="")
+            metrics['ingest_chunks_per_s'] = len(memory.data.texts) / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for _ in range(num_queries):
+                memory.get_relevant(" ".join(rng.choices(WORDS, k=12)), 10)
+            metrics['retrieval_ms'] = (time.perf_counter() - start) / num_queries * 1000
+
+            start = time.perf_counter()
+            Agent("Bench", memory, [], 0, get_prompt()).start_interaction_loop()
+            metrics['agent_steps_per_s'] = steps / (time.perf_counter() - start)
+
+            # A second, untraced pass under tracemalloc, so its overhead stays out of the timings above
+            cfg.set('trace_enabled', False)
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            Agent("Bench", memory, [], 0, get_prompt()).start_interaction_loop()
+            after, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            metrics['memory_growth_kb_per_step'] = (after - before) / steps / 1024
+            metrics['memory_peak_mb'] = peak / 2**20
+            logger.flush()
+            stand_in_stats = server.get_stats()
+
+            from scripts import tracing
+            tracing.trace_writer.close()
+            stages = summarize(read_traces(glob.glob(os.path.join(folder, "traces", "*.jsonl"))))['stage']
+            for stage, values in stages.items():
+                values.sort()
+                metrics[f"{stage}.p50_ms"] = percentile(values, 0.5)
+                metrics[f"{stage}.p95_ms"] = percentile(values, 0.95)
+
+    print(f"stand-in: {stand_in_stats}")
+    for metric, value in metrics.items():
+        print(f"{metric:<32} {value:>10.2f}")
+    return metrics
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Print each metric against the baseline and return the ones that got worse by more than tolerance."""
+    regressions = []
+    print(f"{'metric':<44} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            # Throughputs should go up, latencies and memory should go down; sub-millisecond jitter is ignored
+            worse = -change if metric.endswith("_per_s") else change
+            if metric.endswith("_ms") and abs(value - old) < 1.0:
+                worse = 0
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{name + ':' + metric:<44} {old:>10.2f} {value:>10.2f} {change:>+8.1%}{flag}")
+            if flag:
+                regressions.append(f"{name}:{metric}")
+    return regressions
+
+def profile_imports(modules=("launch_main", "scripts.engine"), top=20):
+    """Import each module in a fresh interpreter under `-X importtime` and print its slowest imports."""
+    for module in modules:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        timings = []
+        for line in result.stderr.splitlines():
+            fields = line.replace("import time:", "", 1).split("|")
+            if len(fields) == 3 and fields[0].strip().isdigit():
+                timings.append((int(fields[1]), int(fields[0]), fields[2].rstrip()))
+        failed = f"  (import failed: {result.stderr.strip().splitlines()[-1]})" if result.returncode else ""
+        total = max((cumulative for cumulative, _, _ in timings), default=0)
+        print(f"{module}: {total / 1000:.1f} ms{failed}")
+        print(f"{'cumulative ms':>14} {'self ms':>9}  package")
+        for cumulative, own, package in sorted(timings, reverse=True)[:top]:
+            print(f"{cumulative / 1000:>14.1f} {own / 1000:>9.1f}  {package}")
+
+BENCHMARKS = {
+    "context": bench_context_assembly,
+    "embeddings": bench_embedding_growth,
+    "memory_index": bench_memory_index,
+    "quantization": bench_quantization,
+    "page_cache": bench_page_cache,
+    "streaming_ingest": bench_streaming_ingest,
+    "console_logging": bench_console_logging,
+    "import_time": profile_imports,
+    "agent": bench_agent,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Auto-CPP-Local micro-benchmarks.")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save the metrics of benchmarks that return them to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against metrics saved with --save-baseline, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change counted as a regression (default: 0.1)")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    results = {}
+    for name in args.names or BENCHMARKS:
+        print(f"== {name}")
+        metrics = BENCHMARKS[name]()
+        if metrics:
+            results[name] = metrics
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"== compared with {args.baseline}")
+        if compare_to_baseline(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
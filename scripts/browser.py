@@ -0,0 +1,82 @@
+# `.\scripts\browser.py` - A Chromium kept alive for the session, shared by the browsing commands.
+
+# Imports
+import atexit
+import contextlib
+import threading
+from scripts.config import get_config
+from scripts.utilities_two import logger
+
+# Global Config
+cfg = get_config()
+
+# Classes
+class BrowserPool:
+    """One Chromium process per session, handing out a fresh isolated context per page.
+
+    The browser is relaunched after `recycle_after` pages or when it has crashed. Playwright's sync
+    API is bound to the thread that started it, so pages must be taken from that same thread.
+    Playwright itself is only imported when the first page is taken.
+    """
+    def __init__(self, headless=True, recycle_after=50):
+        self.headless = headless
+        self.recycle_after = recycle_after
+        self.playwright = None
+        self.browser = None
+        self.uses = 0
+        self.lock = threading.Lock()
+
+    def _ensure_browser(self):
+        if self.browser is not None and (not self.browser.is_connected() or self.uses >= self.recycle_after):
+            logger.debug(f"Recycling browser after {self.uses} pages (connected: {self.browser.is_connected()})")
+            self._close_browser()
+        if self.playwright is None:
+            from playwright.sync_api import sync_playwright
+            self.playwright = sync_playwright().start()
+        if self.browser is None:
+            self.browser = self.playwright.chromium.launch(headless=self.headless)
+            self.uses = 0
+        return self.browser
+
+    @contextlib.contextmanager
+    def page(self):
+        with self.lock:
+            browser = self._ensure_browser()
+            self.uses += 1
+        from playwright.sync_api import Error as PlaywrightError
+        context = browser.new_context(user_agent=cfg.browsing_settings['user_agent'])
+        context.set_default_timeout(cfg.browsing_settings['playwright_timeout'])
+        try:
+            yield context.new_page()
+        finally:
+            try:
+                context.close()
+            except PlaywrightError as e:
+                logger.debug(f"Browser context close failed, browser will be recycled: {e}")
+
+    def _close_browser(self):
+        if self.browser is not None:
+            from playwright.sync_api import Error as PlaywrightError
+            try:
+                self.browser.close()
+            except PlaywrightError:
+                pass
+            self.browser = None
+
+    def close(self):
+        with self.lock:
+            self._close_browser()
+            if self.playwright is not None:
+                self.playwright.stop()
+                self.playwright = None
+
+# Globals
+browser_pool = BrowserPool(cfg.get_bool('playwright_headless'), cfg.get_int('browser_recycle_after'))
+cfg.subscribe('browser_recycle_after', lambda key, value: setattr(browser_pool, 'recycle_after', cfg.get_int(key)))
+cfg.subscribe('playwright_headless', lambda key, value: setattr(browser_pool, 'headless', cfg.get_bool(key)))
+
+# Functions
+def close_browser_pool():
+    browser_pool.close()
+
+atexit.register(close_browser_pool)
@@ -0,0 +1,108 @@
+# `.\scripts\chunking.py` - Token-aware chunking of text streams, shared by ingestion and summarization.
+
+# Imports
+import re
+from collections import deque
+from typing import Callable, Iterable, Iterator, Optional
+
+# Globals
+CODE_FENCE = re.compile(r"^\s*(```|~~~)")
+# A block this many characters per token of budget already overflows a chunk, so it is cut at a line
+BLOCK_CHARS_PER_TOKEN = 8
+# Finer and finer ways to cut a block that does not fit: lines, sentences, then words
+SPLITTERS = (
+    lambda text: text.splitlines(keepends=True),
+    lambda text: re.findall(r"[^.!?\n]*(?:[.!?]+|$)\s*", text),
+    lambda text: re.findall(r"\S+\s*|\s+", text),
+)
+
+# Functions
+def iter_blocks(lines: Iterable[str], max_chars: int = None) -> Iterator[str]:
+    """Group lines into blank-line separated paragraphs, keeping fenced code blocks whole.
+
+    A block is also cut at a line once it reaches max_chars, so text without blank lines
+    (logs, CSV, minified code) is yielded as it is read instead of held whole.
+    """
+    block, size, in_fence, has_text = [], 0, False, False
+    for line in lines:
+        if CODE_FENCE.match(line):
+            if not in_fence and has_text:
+                yield "".join(block)
+                block, size = [], 0
+            block.append(line)
+            size += len(line)
+            if in_fence:
+                yield "".join(block)
+                block, size = [], 0
+            in_fence = has_text = not in_fence
+        elif not in_fence and not line.strip():
+            block.append(line)
+            size += len(line)
+            if has_text:
+                yield "".join(block)
+                block, size, has_text = [], 0, False
+        else:
+            block.append(line)
+            size += len(line)
+            has_text = True
+        if max_chars and size >= max_chars:
+            yield "".join(block)
+            block, size, has_text = [], 0, in_fence
+    if block:
+        yield "".join(block)
+
+def split_oversized(text: str, max_tokens: int, count_fn: Callable[[str], int], level: int = 0) -> Iterator[tuple]:
+    """Yield (piece, tokens) pieces of text, cutting at the coarsest boundary that makes them fit."""
+    num_tokens = count_fn(text)
+    if num_tokens <= max_tokens:
+        yield text, num_tokens
+    elif level < len(SPLITTERS):
+        pieces = [piece for piece in SPLITTERS[level](text) if piece]
+        if len(pieces) <= 1:
+            yield from split_oversized(text, max_tokens, count_fn, level + 1)
+            return
+        for piece in pieces:
+            yield from split_oversized(piece, max_tokens, count_fn, level + 1)
+    else:
+        # A single "word" longer than the budget (minified code, base64): cut it by characters, shortening
+        # each cut until it fits, as tokens per character vary; only a lone character can still exceed it
+        step = max(1, len(text) * max_tokens // num_tokens)
+        start = 0
+        while start < len(text):
+            piece = text[start:start + step]
+            piece_tokens = count_fn(piece)
+            while piece_tokens > max_tokens and len(piece) > 1:
+                piece = piece[:max(1, min(len(piece) - 1, len(piece) * max_tokens // piece_tokens))]
+                piece_tokens = count_fn(piece)
+            yield piece, piece_tokens
+            start += len(piece)
+
+def chunk_lines(lines: Iterable[str], max_tokens: int, overlap_tokens: int = 0,
+                count_fn: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    """Lazily pack lines (with their line endings) into chunks of at most max_tokens tokens.
+
+    Chunks end on paragraph, then line, sentence and word boundaries, and code fences are only
+    split when a single code block is larger than a chunk. Each chunk starts with up to
+    overlap_tokens tokens of trailing pieces from the one before.
+    """
+    if count_fn is None:
+        from scripts.models import count_string_tokens
+        count_fn = count_string_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    pieces, used, fresh = deque(), 0, False
+    for block in iter_blocks(lines, max_tokens * BLOCK_CHARS_PER_TOKEN):
+        for piece, num_tokens in split_oversized(block, max_tokens, count_fn):
+            if fresh and used + num_tokens > max_tokens:
+                yield "".join(text for text, _ in pieces)
+                while pieces and (used > overlap_tokens or used + num_tokens > max_tokens or not overlap_tokens):
+                    used -= pieces.popleft()[1]
+                fresh = False
+            pieces.append((piece, num_tokens))
+            used += num_tokens
+            fresh = True
+    if fresh:
+        yield "".join(text for text, _ in pieces)
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = 0,
+               count_fn: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    return chunk_lines(text.splitlines(keepends=True), max_tokens, overlap_tokens, count_fn)
@@ -1,25 +1,58 @@
 # `.\scripts\config.py`
 
 # Imports
-import os
+import json, os, threading
 import yaml
 
+# Globals
+COMPILED_CONFIG = os.path.join(os.path.dirname(__file__), '..', 'cache', 'persistence_python.json')
+SETTINGS_GROUPS = ('program_settings', 'session_settings', 'task_management_settings', 'system_settings',
+                   'llm_model_settings', 'browsing_settings', 'persistent_session_data')
+shared_config = None
+shared_config_lock = threading.Lock()
+
 class Config:
     def __init__(self):
         self.config_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'persistence_python.yaml')
+        self.subscribers = {}
         self.load_config()
 
     def load_config(self):
-        with open(self.config_file, 'r') as file:
-            config = yaml.safe_load(file)
+        config = self._read_config_file()
+        previous = self.as_dict() if hasattr(self, 'program_settings') else None
+        for group in SETTINGS_GROUPS:
+            settings = getattr(self, f"_load_{group}")(config)
+            if previous is None:
+                setattr(self, group, settings)
+            else:
+                # Update in place so modules holding a settings dict see the reloaded values
+                getattr(self, group).clear()
+                getattr(self, group).update(settings)
+        if previous is not None:
+            for key, value in self.as_dict().items():
+                if previous.get(key) != value:
+                    self._notify(key, value)
 
-        self.program_settings = self._load_program_settings(config)
-        self.session_settings = self._load_session_settings(config)
-        self.task_management_settings = self._load_task_management_settings(config)
-        self.system_settings = self._load_system_settings(config)
-        self.llm_model_settings = self._load_llm_model_settings(config)
-        self.browsing_settings = self._load_browsing_settings(config)
-        self.persistent_session_data = self._load_persistent_session_data(config)
+    def _read_config_file(self):
+        """Parse the YAML, or reuse its compiled JSON form while the YAML's mtime and size are unchanged."""
+        stat = os.stat(self.config_file)
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        try:
+            with open(COMPILED_CONFIG, 'r') as file:
+                compiled = json.load(file)
+            if compiled['stamp'] == stamp:
+                return compiled['config']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        with open(self.config_file, 'r') as file:
+            config = yaml.safe_load(file) or {}
+        try:
+            os.makedirs(os.path.dirname(COMPILED_CONFIG), exist_ok=True)
+            with open(COMPILED_CONFIG, 'w') as file:
+                json.dump({'stamp': stamp, 'config': config}, file, default=str)
+        except OSError:
+            pass
+        return config
 
     def _load_program_settings(self, config):
         return {
@@ -51,8 +84,27 @@ class Config:
         return {
             'memory_backend': config.get('memory_backend', 'local'),
             'memory_index': config.get('memory_index', 'autoccp-lite'),
+            'memory_ivf_nprobe': config.get('memory_ivf_nprobe', 8),
+            'memory_hnsw_ef': config.get('memory_hnsw_ef', 64),
+            'embedding_cache_size': config.get('embedding_cache_size', 50000),
+            'memory_quantization': config.get('memory_quantization', 'none'),
+            'memory_rerank': config.get('memory_rerank', 4),
+            'ingest_chunk_tokens': config.get('ingest_chunk_tokens', 1000),
+            'ingest_overlap_tokens': config.get('ingest_overlap_tokens', 100),
+            'ingest_commit_chunks': config.get('ingest_commit_chunks', 64),
+            'ingest_workers': config.get('ingest_workers', 4),
+            'ingest_stream_mb': config.get('ingest_stream_mb', 32),
             'gpu_threads_used': config.get('gpu_threads_used', 1024),
-            'speak_mode': config.get('speak_mode', False)
+            'speak_mode': config.get('speak_mode', False),
+            'fast_console': config.get('fast_console', False),
+            'trace_enabled': config.get('trace_enabled', True),
+            'command_wait': config.get('command_wait', 30),
+            'command_timeout': config.get('command_timeout', 600),
+            'command_cpu_seconds': config.get('command_cpu_seconds', 300),
+            'command_memory_mb': config.get('command_memory_mb', 0),
+            'command_output_kb': config.get('command_output_kb', 64),
+            'command_max_jobs': config.get('command_max_jobs', 4),
+            'command_parallelism': config.get('command_parallelism', 4)
         }
 
     def _load_llm_model_settings(self, config):
@@ -62,18 +114,34 @@ class Config:
             'code_llm_model': config.get('code_llm_model', './models/DeepSeek-Coder-V2-Lite-Instruct-Q*.gguf'),
             'context_size': config.get('context_size', 8192),
             'embed_dim': config.get('embed_dim', 4096),
+            'embed_batch_size': config.get('embed_batch_size', 32),
             'smart_token_limit': config.get('smart_token_limit', 8000),
             'max_tokens': config.get('max_tokens', 4000),
-            'temperature': config.get('temperature', 1)
+            'temperature': config.get('temperature', 1),
+            'llm_backend': config.get('llm_backend', 'server'),
+            'server_host': config.get('server_host', '127.0.0.1'),
+            'server_port': config.get('server_port', 8080),
+            'server_parallel_slots': config.get('server_parallel_slots', 2),
+            'server_startup_timeout': config.get('server_startup_timeout', 120),
+            'embedding_server': config.get('embedding_server', False),
+            'prompt_cache': config.get('prompt_cache', True)
         }
 
     def _load_browsing_settings(self, config):
         return {
-            'browse_chunk_max_length': config.get('browse_chunk_max_length', 8192),
+            'browse_chunk_tokens': config.get('browse_chunk_tokens', 1500),
             'browse_summary_max_token': config.get('browse_summary_max_token', 300),
             'user_agent': config.get('user_agent', 'Mozilla/5.0'),
             'playwright_headless': config.get('playwright_headless', True),
-            'playwright_timeout': config.get('playwright_timeout', 30000)
+            'playwright_timeout': config.get('playwright_timeout', 30000),
+            'browser_recycle_after': config.get('browser_recycle_after', 50),
+            'browse_max_workers': config.get('browse_max_workers', 4),
+            'browse_per_host_limit': config.get('browse_per_host_limit', 2),
+            'browse_batch_timeout': config.get('browse_batch_timeout', 60),
+            'page_cache_ttl': config.get('page_cache_ttl', 3600),
+            'page_cache_max_mb': config.get('page_cache_max_mb', 256),
+            'page_cache_offline': config.get('page_cache_offline', False),
+            'summary_cache_size': config.get('summary_cache_size', 20000)
         }
 
     def _load_persistent_session_data(self, config):
@@ -97,4 +165,69 @@ class Config:
         }
 
         with open(self.config_file, 'w') as file:
-            yaml.dump(config, file)
\ No newline at end of file
+            yaml.dump(config, file)
+
+    def as_dict(self):
+        return {key: value for group in SETTINGS_GROUPS for key, value in getattr(self, group).items()}
+
+    def _group_of(self, key):
+        for group in SETTINGS_GROUPS:
+            if key in getattr(self, group):
+                return getattr(self, group)
+        raise KeyError(f"Unknown setting '{key}'")
+
+    def get(self, key, default=None):
+        try:
+            return self._group_of(key)[key]
+        except KeyError:
+            return default
+
+    def get_str(self, key) -> str:
+        return str(self.get(key, ''))
+
+    def get_int(self, key) -> int:
+        return int(self._group_of(key)[key])
+
+    def get_float(self, key) -> float:
+        return float(self._group_of(key)[key])
+
+    def get_bool(self, key) -> bool:
+        value = self._group_of(key)[key]
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', 'yes', 'on', '1')
+        return bool(value)
+
+    def set(self, key, value, save=False):
+        """Change a setting, notifying its subscribers when the value differs."""
+        group = self._group_of(key)
+        if group[key] != value:
+            group[key] = value
+            self._notify(key, value)
+        if save:
+            self.save_config()
+
+    def subscribe(self, key, callback):
+        """Call callback(key, value) whenever the setting changes; key '*' subscribes to every setting."""
+        self.subscribers.setdefault(key, []).append(callback)
+
+    def _notify(self, key, value):
+        for callback in self.subscribers.get(key, []) + self.subscribers.get('*', []):
+            callback(key, value)
+
+    @staticmethod
+    def parse_value(text):
+        """Read a value typed at a menu prompt the way the YAML file would, so '0.7' and 'true' keep their types."""
+        try:
+            value = yaml.safe_load(text)
+        except yaml.YAMLError:
+            return text
+        return text if value is None else value
+
+# Functions
+def get_config():
+    """The process-wide Config, loaded on first use and shared by every module."""
+    global shared_config
+    with shared_config_lock:
+        if shared_config is None:
+            shared_config = Config()
+        return shared_config
\ No newline at end of file
@@ -5,14 +5,15 @@ import os
 import time
 import logging
 from scripts.utilities_one import get_memory, logger, clean_input
-from scripts.config import Config
-from scripts.models import LlamaModel, JsonHandler
-from scripts.prompt import get_prompt, chat_with_ai
-from scripts.operations import execute_command
-from scripts.gradio import create_gradio_interface
+from scripts.config import get_config
+from scripts.models import LlamaModel, JsonHandler, start_model_servers, stop_model_servers, get_prompt_cache_stats
+from scripts.browser import close_browser_pool
+from scripts.prompt import get_prompt, chat_with_ai, create_chat_message
+from scripts.operations import execute_commands
+from scripts.tracing import span
 
 # Global Config
-cfg = Config()
+cfg = get_config()
 
 def clear_folders():
     folders_to_clear = [".\\cache\\downloads", ".\\cache\\working"]
@@ -28,10 +29,12 @@ def clear_folders():
                 print(f"Failed to delete {file_path}. Reason: {e}")
 
 def main():
-    logger.set_level(logging.DEBUG if cfg.program_settings['debug_mode'] else logging.INFO)
+    logger.set_level(logging.DEBUG if cfg.get_bool('debug_mode') else logging.INFO)
+    cfg.subscribe('debug_mode', lambda key, value: logger.set_level(logging.DEBUG if cfg.get_bool(key) else logging.INFO))
 
     chat_model = LlamaModel('chat')
     code_model = LlamaModel('code')
+    start_model_servers()
 
     ai_name = cfg.session_settings.get('ai_name', 'Auto-CPP-Local')
     prompt = get_prompt()
@@ -60,14 +63,18 @@ class Agent:
                 break
 
             try:
-                assistant_reply = chat_with_ai(
-                    self.prompt,
-                    self.user_input,
-                    self.full_message_history,
-                    self.memory,
-                    cfg.llm_model_settings['smart_token_limit']
-                )
-                self.process_assistant_reply(assistant_reply)
+                with span("agent.step", step=loop_count):
+                    assistant_reply = chat_with_ai(
+                        self.prompt,
+                        self.user_input,
+                        self.full_message_history,
+                        self.memory,
+                        cfg.llm_model_settings['smart_token_limit'],
+                        on_token=logger.stream
+                    )
+                    logger.stream("\n")
+                    logger.debug(f"Prompt cache stats: {get_prompt_cache_stats()}")
+                    self.process_assistant_reply(assistant_reply)
             except Exception as e:
                 logger.error(f"Error during interaction loop: {str(e)}")
 
@@ -80,23 +87,34 @@ class Agent:
                 print("Continuing...")
 
             self.memory.add(f"Human feedback: {self.user_input}")
-            self.full_message_history.append(JsonHandler.create_chat_message("human", self.user_input))
+            self.full_message_history.append(create_chat_message("human", self.user_input))
 
     def process_assistant_reply(self, assistant_reply):
-        command_name, arguments = JsonHandler.get_command(assistant_reply)
-        if command_name == "Error":
-            logger.error(f"Invalid command: {arguments}")
+        commands = []
+        for command_name, arguments in JsonHandler.get_commands(assistant_reply):
+            if command_name == "Error":
+                logger.error(f"Invalid command: {arguments}")
+            else:
+                commands.append((command_name, arguments))
+        if not commands:
             return
 
-        result = execute_command(command_name, arguments)
+        results = execute_commands(commands)
 
-        if result is not None:
-            self.memory.add(f"Command {command_name} returned: {result}")
-            self.full_message_history.append(JsonHandler.create_chat_message("system", f"Command {command_name} returned: {result}"))
-        else:
-            self.full_message_history.append(JsonHandler.create_chat_message("system", f"Command {command_name} executed successfully."))
+        returned = [f"Command {command_name} returned: {result}" for (command_name, _), result in zip(commands, results) if result is not None]
+        if returned:
+            with span("memory.add"):
+                self.memory.add_many(returned)
+        self.full_message_history.append(create_chat_message("system", "\n\n".join(
+            f"Command {command_name} returned: {result}" if result is not None else f"Command {command_name} executed successfully."
+            for (command_name, _), result in zip(commands, results))))
 
 if __name__ == "__main__":
     clear_folders()  # Clear folders at the start of a new project
-    main()
-    create_gradio_interface()  # Launch Gradio interface in the default browser
\ No newline at end of file
+    try:
+        main()
+        from scripts.gradio import create_gradio_interface  # Gradio is slow to import, so only when the UI is launched
+        create_gradio_interface()  # Launch Gradio interface in the default browser
+    finally:
+        stop_model_servers()  # Shut down resident model servers on exit
+        close_browser_pool()  # Close the shared Chromium
\ No newline at end of file
@@ -3,21 +3,26 @@
 # Imports
 import gradio as gr
 from scripts.utilities_one import get_memory
-from scripts.config import Config
+from scripts.config import get_config
+from scripts.models import LlamaModel
 
 # Initialize memory space
-config = Config()
+config = get_config()
 memory_space = get_memory(config)
 
-# Function to update chat with user message
+# Function to update chat with user message, streaming the reply as it is generated
 def update_chat(user_message):
-    if user_message:
-        memory_space.add(f"User: {user_message}")
-        # Here you could simulate a response (or handle it from another script)
-        memory_space.add("Bot: Response placeholder")
-    
-    # Return the updated chat history
-    return "\n".join(memory_space.get_relevant("chat_history", 10)), ""
+    chat_history = "\n".join(memory_space.get_relevant("chat_history", 10))
+    if not user_message:
+        yield chat_history, ""
+        return
+
+    memory_space.add(f"User: {user_message}")
+    reply = ""
+    for token in LlamaModel('chat').stream_chat_completion([{"role": "user", "content": user_message}]):
+        reply += token
+        yield f"{chat_history}\nUser: {user_message}\nBot: {reply}", ""
+    memory_space.add(f"Bot: {reply}")
 
 # Function to get current project plan
 def get_project_plan():
@@ -49,7 +54,7 @@ def create_gradio_interface():
                 with gr.Row():
                     current_tasks = gr.Textbox(value=get_current_tasks(), label="Current Tasks", interactive=False, lines=10)
 
-    interface.launch(inbrowser=True)  # Launch in the default browser
+    interface.queue().launch(inbrowser=True)  # Queue enables streamed replies; launch in the default browser
 
 # Launch the Gradio interface
 if __name__ == "__main__":
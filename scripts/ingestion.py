@@ -0,0 +1,231 @@
+# `.\scripts\ingestion.py` - Streaming, resumable and incremental ingestion of files into memory.
+
+# Imports
+import hashlib, json, os, shutil, sqlite3, threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from scripts.chunking import chunk_lines, chunk_text
+from scripts.config import get_config
+from scripts.utilities_two import logger
+
+# Global Config
+cfg = get_config()
+CHECKPOINT_FOLDER = os.path.join("cache", "ingest")
+LINE_READ_CHARS = 1 << 16  # Longer lines (minified code, single-line JSON) are read in pieces this size
+
+# Classes
+class IngestCheckpoint:
+    """Progress of an ingestion run, saved after every committed batch so a rerun can resume."""
+    def __init__(self, key: str):
+        self.path = os.path.join(CHECKPOINT_FOLDER, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + ".json")
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, state: dict):
+        os.makedirs(CHECKPOINT_FOLDER, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class IngestManifest:
+    """Ingested files by label, with the size, mtime and content hash seen and the memory ids they produced."""
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files (label TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                          "sha256 TEXT, max_tokens INTEGER, overlap INTEGER, ids TEXT)")
+
+    def get(self, label: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime, sha256, max_tokens, overlap, ids FROM files WHERE label = ?", (label,)).fetchone()
+        if row is None:
+            return None
+        return {'size': row[0], 'mtime': row[1], 'sha256': row[2], 'max_tokens': row[3], 'overlap': row[4], 'ids': json.loads(row[5])}
+
+    def put(self, label: str, entry: Dict):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                label, entry['size'], entry['mtime'], entry['sha256'], entry['max_tokens'], entry['overlap'], json.dumps(entry['ids'])))
+            self.conn.commit()
+
+    def remove(self, label: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM files WHERE label = ?", (label,))
+            self.conn.commit()
+
+    def labels(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT label FROM files")]
+
+    def close(self):
+        self.conn.close()
+
+# Functions
+def iter_file_lines(path: str) -> Iterator[str]:
+    """Yield a file's lines through a buffered reader, never holding the whole file or a whole long line in memory."""
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        yield from iter(lambda: f.readline(LINE_READ_CHARS), "")
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_and_chunk(path: str, max_tokens: int, overlap: int) -> Tuple[str, List[str]]:
+    """Process pool worker: hash and chunk a file that is small enough to read at once."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return hashlib.sha256(data).hexdigest(), list(chunk_text(data.decode("utf-8", errors="replace"), max_tokens, overlap))
+
+def chunk_memory_text(label: str, number: int, chunk: str) -> str:
+    return f"File: {label} | Part: {number}\n{chunk}"
+
+def ingest_path(path: str, memory, label: str = None, max_tokens: int = None, overlap: int = None) -> List[int]:
+    """Stream a file into memory, committing every `ingest_commit_chunks` chunks; returns the memory ids.
+
+    After each committed batch the chunk count and ids are checkpointed against the file's size
+    and mtime, so rerunning an interrupted ingest of an unchanged file skips what is already in memory.
+    """
+    label = label or path
+    max_tokens = max_tokens or cfg.system_settings['ingest_chunk_tokens']
+    overlap = cfg.system_settings['ingest_overlap_tokens'] if overlap is None else overlap
+    commit_every = cfg.system_settings['ingest_commit_chunks']
+    stat = os.stat(path)
+    run = {"size": stat.st_size, "mtime": stat.st_mtime, "max_tokens": max_tokens, "overlap": overlap}
+    checkpoint = IngestCheckpoint(f"file:{os.path.abspath(path)}")
+    saved = checkpoint.load()
+    resumed = all(saved.get(key) == value for key, value in run.items())
+    done, ids = (saved.get("chunks_done", 0), saved.get("ids", [])) if resumed else (0, [])
+    if done:
+        logger.debug(f"Resuming ingest of {label} after {done} chunks")
+
+    batch = []
+    for number, chunk in enumerate(chunk_lines(iter_file_lines(path), max_tokens, overlap), 1):
+        if number <= done:
+            continue
+        batch.append(chunk_memory_text(label, number, chunk))
+        if len(batch) >= commit_every:
+            ids += memory.add_many(batch)
+            checkpoint.save({**run, "chunks_done": number, "ids": ids})
+            batch = []
+    if batch:
+        ids += memory.add_many(batch)
+    checkpoint.clear()
+    return [i for i in ids if i is not None]
+
+def in_scope(label: str, scope: Optional[str]) -> bool:
+    if scope is None:
+        return False
+    scope = os.path.normpath(scope) if scope else "."
+    return scope == "." or os.path.normpath(label).startswith(scope + os.sep)
+
+def ingest_files(files: Iterable[Tuple[str, str]], memory, scope: Optional[str] = None,
+                 max_tokens: int = None, overlap: int = None, workers: int = None) -> Dict:
+    """Ingest the new and changed (path, label) files, tombstoning the memories of changed and removed ones.
+
+    Files are compared with the manifest by size and mtime, then by content hash. Manifest files
+    under `scope` that are no longer listed count as removed. Files up to `ingest_stream_mb` are read
+    and chunked on a process pool and their chunks embedded together in batches of
+    `ingest_commit_chunks`; larger files are streamed by ingest_path in this process.
+    """
+    max_tokens = max_tokens or cfg.system_settings['ingest_chunk_tokens']
+    overlap = cfg.system_settings['ingest_overlap_tokens'] if overlap is None else overlap
+    workers = workers or cfg.system_settings['ingest_workers']
+    commit_every = cfg.system_settings['ingest_commit_chunks']
+    stream_bytes = cfg.system_settings['ingest_stream_mb'] * 2**20
+    params = {'max_tokens': max_tokens, 'overlap': overlap}
+    manifest = IngestManifest(os.path.join(CHECKPOINT_FOLDER, f"{os.path.basename(cfg.system_settings['memory_index'])}.manifest.sqlite3"))
+    report = {'ingested': 0, 'unchanged': 0, 'removed': 0, 'errors': []}
+
+    files = list(files)
+    listed = {label for _, label in files}
+    for label in manifest.labels():
+        if label not in listed and in_scope(label, scope):
+            memory.delete_many(manifest.get(label)['ids'])
+            manifest.remove(label)
+            report['removed'] += 1
+
+    small, large = [], []
+    for path, label in files:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            logger.error(f"Ingest error: '{label}': {e}")
+            report['errors'].append(label)
+            continue
+        entry = manifest.get(label)
+        if entry and (entry['size'], entry['mtime'], entry['max_tokens'], entry['overlap']) == (stat.st_size, stat.st_mtime, max_tokens, overlap):
+            report['unchanged'] += 1
+            continue
+        (small if stat.st_size <= stream_bytes else large).append((path, label, stat, entry))
+
+    def unchanged(label, stat, entry, sha256):
+        if entry and entry['sha256'] == sha256 and (entry['max_tokens'], entry['overlap']) == (max_tokens, overlap):
+            manifest.put(label, {**entry, 'size': stat.st_size, 'mtime': stat.st_mtime})
+            report['unchanged'] += 1
+            return True
+        return False
+
+    def finish(label, stat, entry, sha256, ids):
+        if entry:
+            memory.delete_many(entry['ids'])
+        manifest.put(label, {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256, **params, 'ids': ids})
+        report['ingested'] += 1
+
+    pending = []
+    def flush():
+        texts = [chunk_memory_text(label, number, chunk) for label, _, _, _, chunks in pending for number, chunk in enumerate(chunks, 1)]
+        ids = memory.add_many(texts) if texts else []
+        start = 0
+        for label, stat, entry, sha256, chunks in pending:
+            finish(label, stat, entry, sha256, [i for i in ids[start:start + len(chunks)] if i is not None])
+            start += len(chunks)
+        pending.clear()
+
+    if small:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(read_and_chunk, path, max_tokens, overlap): (label, stat, entry) for path, label, stat, entry in small}
+            pending_chunks = 0
+            for future in as_completed(futures):
+                label, stat, entry = futures[future]
+                try:
+                    sha256, chunks = future.result()
+                except (OSError, ValueError) as e:
+                    logger.error(f"Ingest error: '{label}': {e}")
+                    report['errors'].append(label)
+                    continue
+                if unchanged(label, stat, entry, sha256):
+                    continue
+                pending.append((label, stat, entry, sha256, chunks))
+                pending_chunks += len(chunks)
+                if pending_chunks >= commit_every:
+                    flush()
+                    pending_chunks = 0
+        flush()
+
+    for path, label, stat, entry in large:
+        try:
+            sha256 = file_digest(path)
+            if not unchanged(label, stat, entry, sha256):
+                finish(label, stat, entry, sha256, ingest_path(path, memory, label, max_tokens, overlap))
+        except (OSError, ValueError) as e:
+            logger.error(f"Ingest error: '{label}': {e}")
+            report['errors'].append(label)
+    manifest.close()
+    logger.debug(f"Ingest report: {report}")
+    return report
+
+def clear_ingest_checkpoints():
+    shutil.rmtree(CHECKPOINT_FOLDER, ignore_errors=True)
@@ -0,0 +1,260 @@
+# `.\scripts\jobs.py` - Shell and Python commands run as limited background jobs, with capped output the agent can poll.
+
+# Imports
+import atexit, codecs, locale, os, signal, subprocess, threading, time
+from typing import Dict, List, Optional, Tuple
+from scripts.config import get_config
+from scripts.utilities_two import logger
+
+# Globals
+cfg = get_config()
+FINISHED_JOBS_KEPT = 50
+CREATE_SUSPENDED = 0x00000004  # Windows process creation flag: the first thread waits to be resumed
+READER_GRACE = 5  # Seconds to wait for the output pipes to close after a job is killed
+
+# Classes
+class OutputBuffer:
+    """The last `max_chars` characters of a stream, addressed by absolute offsets so readers can resume."""
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.text = ""
+        self.start = 0  # Offset of self.text[0]; everything before it has been dropped
+        self.lock = threading.Lock()
+
+    def append(self, text: str):
+        with self.lock:
+            self.text += text
+            if len(self.text) > self.max_chars:
+                cut = len(self.text) - self.max_chars
+                self.text = self.text[cut:]
+                self.start += cut
+
+    def read(self, offset: int = 0) -> Tuple[str, int]:
+        """Text from offset to the end, noting how much of it was already dropped, and the end offset to read from next."""
+        with self.lock:
+            dropped = max(self.start - offset, 0)
+            text = self.text[max(offset - self.start, 0):]
+            end = self.start + len(self.text)
+        return (f"[... {dropped} characters dropped ...]\n{text}" if dropped else text), end
+
+class Job:
+    """One child process, its output readers and a watchdog that kills it at the wall-clock limit."""
+    def __init__(self, job_id: int, command, shell: bool, cwd: str, timeout: float, cpu_seconds: int, memory_bytes: int, output_chars: int):
+        self.id = job_id
+        self.command = command if isinstance(command, str) else subprocess.list2cmdline(command)
+        self.timeout = timeout
+        self.stdout, self.stderr = OutputBuffer(output_chars), OutputBuffer(output_chars)
+        self.read_offsets = {'stdout': 0, 'stderr': 0}
+        self.state = "running"
+        self.started = time.time()
+        self.ended = None
+        # Limits are in place before the command runs: set by `ulimit` in the shell that execs it on POSIX, and on
+        # Windows the process starts suspended until it is inside its Job Object
+        self.windows_job = create_windows_job(job_id, cpu_seconds, memory_bytes) if os.name == 'nt' else None
+        if os.name != 'nt':
+            command, shell = limited_command(command, shell, cpu_seconds, memory_bytes)
+        self.process = subprocess.Popen(command, shell=shell, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        start_new_session=os.name != 'nt', creationflags=CREATE_SUSPENDED if self.windows_job is not None else 0)
+        if self.windows_job is not None:
+            start_in_windows_job(self)
+        self.readers = [threading.Thread(target=self._read, args=(stream, buffer), name=f"job{job_id}-{name}", daemon=True)
+                        for name, stream, buffer in (("stdout", self.process.stdout, self.stdout), ("stderr", self.process.stderr, self.stderr))]
+        for reader in self.readers:
+            reader.start()
+        self.watchdog = threading.Thread(target=self._watch, name=f"job{job_id}-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def _read(self, stream, buffer: OutputBuffer):
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+        with stream:
+            for block in iter(lambda: stream.read1(65536), b""):
+                buffer.append(decoder.decode(block))
+            buffer.append(decoder.decode(b"", final=True))
+
+    def _watch(self):
+        deadline = self.started + self.timeout
+        try:
+            self.process.wait(self.timeout)
+        except subprocess.TimeoutExpired:
+            self.kill("timed out")
+        # Children left running in the background keep the pipes open, so the time limit covers them too
+        for reader in self.readers:
+            reader.join(max(deadline - time.time(), 0))
+        if any(reader.is_alive() for reader in self.readers):
+            self.kill("timed out")
+            for reader in self.readers:
+                reader.join(READER_GRACE)
+        self.process.wait()
+        if self.state == "running":
+            self.state = "exited"
+        self.ended = time.time()
+
+    def kill(self, state: str = "killed"):
+        """Kill the process and everything it started, including what is still running after the process exited."""
+        if self.state == "running":
+            self.state = state
+        try:
+            if self.windows_job is not None:
+                import win32job
+                win32job.TerminateJobObject(self.windows_job, 1)
+            elif os.name != 'nt':
+                os.killpg(self.process.pid, signal.SIGKILL)  # The job's session, led by the process
+            elif self.process.poll() is None:
+                self.process.kill()
+        except (OSError, ProcessLookupError) as e:
+            logger.debug(f"Job {self.id}: kill failed, processes already gone: {e}")
+
+    def done(self) -> bool:
+        return self.ended is not None
+
+    def wait(self, timeout: float = None) -> bool:
+        self.watchdog.join(timeout)
+        return self.done()
+
+    def report(self, new_only: bool = True) -> str:
+        """Status and output, by default only what was written since the previous report."""
+        elapsed = (self.ended or time.time()) - self.started
+        status = f"exit code {self.process.returncode}" if self.state == "exited" else self.state
+        parts = [f"Job {self.id} ({status}, {elapsed:.1f}s): {self.command}"]
+        for name, buffer in (("stdout", self.stdout), ("stderr", self.stderr)):
+            text, self.read_offsets[name] = buffer.read(self.read_offsets[name] if new_only else 0)
+            parts.append(f"{name.upper()}:\n{text}")
+        return "\n".join(parts)
+
+class JobRegistry:
+    """Running and recently finished jobs by id, with a cap on how many run at once."""
+    def __init__(self):
+        self.jobs: Dict[int, Job] = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def start(self, command, shell: bool = False, cwd: str = None, timeout: float = None) -> Job:
+        with self.lock:
+            running = [job for job in self.jobs.values() if not job.done()]
+            if len(running) >= cfg.get_int('command_max_jobs'):
+                raise RuntimeError(f"{len(running)} jobs are already running (ids {', '.join(str(job.id) for job in running)}); poll or kill one first")
+            finished = [job_id for job_id, job in self.jobs.items() if job.done()]
+            for job_id in finished[:max(len(finished) - FINISHED_JOBS_KEPT, 0)]:
+                del self.jobs[job_id]
+            job = Job(self.next_id, command, shell, cwd, timeout or cfg.get_float('command_timeout'), cfg.get_int('command_cpu_seconds'),
+                      cfg.get_int('command_memory_mb') * 2**20, cfg.get_int('command_output_kb') * 1024)
+            self.jobs[job.id] = job
+            self.next_id += 1
+        logger.debug(f"Job {job.id} started: {job.command}")
+        return job
+
+    def get(self, job_id) -> Optional[Job]:
+        try:
+            return self.jobs.get(int(job_id))
+        except (TypeError, ValueError):
+            return None
+
+    def all_jobs(self) -> List[Job]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def kill_all(self):
+        for job in self.all_jobs():
+            job.kill()
+
+job_registry = JobRegistry()
+atexit.register(job_registry.kill_all)
+
+# Functions
+def limited_command(command, shell: bool, cpu_seconds: int, memory_bytes: int):
+    """The command and shell flag to run it under `/bin/sh` after `ulimit` caps CPU time and data size.
+    A preexec_fn could set the same limits, but forking with one while other threads hold locks can deadlock the child.
+    Data size (RLIMIT_DATA) is capped rather than address space, which runtimes like the JVM, node and Go reserve far beyond what they use."""
+    import resource
+    ulimits = []
+    for flag, limit, value, unit in (("-t", resource.RLIMIT_CPU, cpu_seconds, 1), ("-d", resource.RLIMIT_DATA, memory_bytes, 1024)):
+        if value:
+            hard = resource.getrlimit(limit)[1]
+            ulimits.append(f"ulimit {flag} {(value if hard == resource.RLIM_INFINITY else min(value, hard)) // unit}")
+    if not ulimits:
+        return command, shell
+    script = " && ".join(ulimits) + " || exit 126; "
+    if shell:
+        return ["/bin/sh", "-c", script + 'exec /bin/sh -c "$1"', "sh", command], False
+    return ["/bin/sh", "-c", script + 'exec "$@"', "sh"] + ([command] if isinstance(command, str) else list(command)), False
+
+def create_windows_job(job_id: int, cpu_seconds: int, memory_bytes: int):
+    """A Job Object that kills everything in it when terminated or closed, with the CPU and memory caps. Limits of 0 are left unset."""
+    try:
+        import win32job
+        windows_job = win32job.CreateJobObject(None, "")
+        info = win32job.QueryInformationJobObject(windows_job, win32job.JobObjectExtendedLimitInformation)
+        flags = win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+        if cpu_seconds:
+            flags |= win32job.JOB_OBJECT_LIMIT_JOB_TIME
+            info['BasicLimitInformation']['PerJobUserTimeLimit'] = cpu_seconds * 10_000_000  # 100 ns units
+        if memory_bytes:
+            flags |= win32job.JOB_OBJECT_LIMIT_PROCESS_MEMORY
+            info['ProcessMemoryLimit'] = memory_bytes
+        info['BasicLimitInformation']['LimitFlags'] = flags
+        win32job.SetInformationJobObject(windows_job, win32job.JobObjectExtendedLimitInformation, info)
+        return windows_job
+    except Exception as e:
+        # pywin32 missing or the job refused: the wall-clock timeout still applies, to the started process only
+        logger.warn(f"Job {job_id}: CPU and memory limits not applied: {e}")
+        return None
+
+def start_in_windows_job(job: Job):
+    """Put the suspended process in its Job Object, which children it starts then inherit, and let it run."""
+    import win32api, win32con, win32job
+    try:
+        handle = win32api.OpenProcess(win32con.PROCESS_SET_QUOTA | win32con.PROCESS_TERMINATE, False, job.process.pid)
+        try:
+            win32job.AssignProcessToJobObject(job.windows_job, handle)
+        finally:
+            win32api.CloseHandle(handle)
+    except Exception as e:
+        logger.warn(f"Job {job.id}: CPU and memory limits not applied: {e}")
+        job.windows_job = None
+    try:
+        resume_windows_threads(job.process.pid)
+    except OSError:
+        job.process.kill()  # Left suspended it would only hold the pipes open until the timeout
+        raise
+
+def resume_windows_threads(pid: int):
+    """Resume the threads of a process started with CREATE_SUSPENDED, found with a Toolhelp snapshot since Popen keeps no thread handle."""
+    import ctypes
+    from ctypes import wintypes
+
+    class THREADENTRY32(ctypes.Structure):
+        _fields_ = [("dwSize", wintypes.DWORD), ("cntUsage", wintypes.DWORD), ("th32ThreadID", wintypes.DWORD), ("th32OwnerProcessID", wintypes.DWORD),
+                    ("tpBasePri", wintypes.LONG), ("tpDeltaPri", wintypes.LONG), ("dwFlags", wintypes.DWORD)]
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+    kernel32.OpenThread.restype = wintypes.HANDLE
+    kernel32.ResumeThread.restype = wintypes.DWORD
+    snapshot = kernel32.CreateToolhelp32Snapshot(0x00000004, 0)  # TH32CS_SNAPTHREAD
+    if snapshot in (None, wintypes.HANDLE(-1).value):
+        raise ctypes.WinError(ctypes.get_last_error())
+    resumed = 0
+    try:
+        entry = THREADENTRY32(dwSize=ctypes.sizeof(THREADENTRY32))
+        more = kernel32.Thread32First(snapshot, ctypes.byref(entry))
+        while more:
+            if entry.th32OwnerProcessID == pid:
+                thread = kernel32.OpenThread(0x0002, False, entry.th32ThreadID)  # THREAD_SUSPEND_RESUME
+                if thread:
+                    resumed += kernel32.ResumeThread(thread) != 0xFFFFFFFF
+                    kernel32.CloseHandle(thread)
+            more = kernel32.Thread32Next(snapshot, ctypes.byref(entry))
+    finally:
+        kernel32.CloseHandle(snapshot)
+    if not resumed:
+        raise OSError(f"Could not resume process {pid}")
+
+def run_or_background(command, shell: bool = False, cwd: str = None) -> str:
+    """Run a command, returning its output if it ends within `command_wait` seconds, else its job id to poll."""
+    try:
+        job = job_registry.start(command, shell=shell, cwd=cwd)
+    except (OSError, RuntimeError) as e:
+        return f"Error starting command: {str(e)}"
+    if job.wait(cfg.get_float('command_wait')):
+        return job.report()
+    return (f"Still running as job {job.id} after {cfg.get_float('command_wait'):.0f}s, it will be stopped after "
+            f"{job.timeout:.0f}s. Output so far:\n{job.report()}\nUse poll_job to check on it, or kill_job to stop it.")
@@ -1,25 +1,34 @@
 # `.\scripts\management.py`
 
 # Imports
-from models import create_chat_completion, call_ai_function
 from typing import List, Optional, Tuple
-import json, requests, os
-from config import Config
-from models import call_ai_function, create_chat_completion
-from utilities_one import LocalCache, logger, TaskTracker
-from urllib.parse import urlparse, urljoin
+import json, requests, os, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from bs4 import BeautifulSoup
+from scripts.chunking import chunk_text
+from scripts.config import get_config
+from scripts.models import LlamaModel, call_ai_function, count_string_tokens
+from scripts.pagecache import PageCache, SummaryCache
+from scripts.utilities_one import LocalCache, logger
+from urllib.parse import urlparse, urlsplit, urlunsplit
 import argparse, logging
-from operations import ingest_file, search_files, evaluate_task_success, break_down_task
+from scripts.operations import ingest_file, search_files, evaluate_task_success, break_down_task, safe_join, WORKSPACE_FOLDER
+from scripts.ingestion import ingest_files
 import threading
 
 # Global Config
-cfg = Config()
+cfg = get_config()
 memory = LocalCache(cfg)
-model = Llama(model_path=cfg.llm_model_settings['smart_llm_model'])
-task_tracker = TaskTracker()  # Initialize TaskTracker for managing tasks
-WORKSPACE_FOLDER = ".\workspace"
+model = LlamaModel('chat')
 session = requests.Session()
 session.headers.update({'User-Agent': cfg.browsing_settings['user_agent']})
+page_cache = PageCache(os.path.join("cache", "pages.sqlite3"), cfg.browsing_settings['page_cache_ttl'],
+                       cfg.browsing_settings['page_cache_max_mb'] * 2**20, cfg.browsing_settings['page_cache_offline'])
+cfg.subscribe('page_cache_ttl', lambda key, value: setattr(page_cache, 'ttl', cfg.get_float(key)))
+cfg.subscribe('page_cache_offline', lambda key, value: setattr(page_cache, 'offline', cfg.get_bool(key)))
+summary_cache = SummaryCache(os.path.join("cache", "summaries.sqlite3"), cfg.browsing_settings['summary_cache_size'])
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
 
 class TaskTracker:
     def __init__(self):
@@ -43,6 +52,8 @@ class TaskTracker:
         with self.lock:
             return self.tasks
 
+task_tracker = TaskTracker()  # Initialize TaskTracker for managing tasks
+
 def configure_logging():
     logging.basicConfig(filename='log-ingestion.txt',
                         filemode='a',
@@ -58,29 +69,85 @@ def is_valid_url(url):
     except ValueError:
         return False
 
-def sanitize_url(url):
-    return urljoin(url, urlparse(url).path)
+def page_cache_key(url):
+    """The full URL with scheme and host lowercased and the fragment dropped; the query selects a different page."""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
 
 def check_local_file_access(url):
     return any(url.startswith(prefix) for prefix in ['file:///', 'file://localhost', 'http://localhost', 'https://localhost'])
 
-def get_response(url, timeout=10):
+def get_response(url, timeout=10, headers=None):
     try:
         if check_local_file_access(url):
             raise ValueError('Restricted local file access')
         if not url.startswith(('http://', 'https://')):
             raise ValueError('Invalid URL')
-        response = session.get(sanitize_url(url), timeout=timeout)
+        response = session.get(page_cache_key(url), timeout=timeout, headers=headers)  # The URL the page is cached under
         return (response, None) if response.status_code < 400 else (None, f"HTTP {response.status_code}")
     except (ValueError, requests.exceptions.RequestException) as e:
         return None, str(e)
 
-def scrape_text(url):
-    response, error = get_response(url)
-    if error: return error
+def get_host_semaphore(url):
+    host = urlparse(url).netloc.lower()
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(cfg.browsing_settings['browse_per_host_limit'])
+        return host_semaphores[host]
+
+def load_page(url, headers):
+    """Fetch and extract one page for the page cache; None means the server answered 304."""
+    with get_host_semaphore(url):
+        response, error = get_response(url, headers=headers)
+    if error:
+        raise OSError(error)
+    if response.status_code == 304:
+        return None
     soup = BeautifulSoup(response.text, "html.parser")
+    return {"text": soup_to_text(soup), "links": extract_hyperlinks(soup),
+            "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+def get_page(url):
+    """Return (page, error); page holds the extracted 'text' and 'links', served from the page cache when possible."""
+    try:
+        return page_cache.get(page_cache_key(url), lambda headers: load_page(url, headers)), None
+    except (OSError, LookupError) as e:
+        return None, str(e)
+
+def fetch_many(urls, timeout=None):
+    """Get pages on a bounded thread pool, yielding (index, page, error) in completion order.
+
+    Requests to one host are capped at `browse_per_host_limit`; urls still pending when the batch
+    `timeout` expires are yielded with a timeout error instead of holding up the rest. Only time spent
+    waiting for pages counts against the timeout, not the time the consumer takes between yields.
+    """
+    timeout = cfg.browsing_settings['browse_batch_timeout'] if timeout is None else timeout
+    executor = ThreadPoolExecutor(max_workers=cfg.browsing_settings['browse_max_workers'])
+    futures = {executor.submit(get_page, url): i for i, url in enumerate(urls)}
+    pending, remaining = set(futures), timeout
+    try:
+        while pending:
+            started = time.monotonic()
+            done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            remaining -= time.monotonic() - started
+            if not done:
+                break
+            for future in sorted(done, key=futures.get):
+                yield (futures[future], *future.result())
+        for future in pending:
+            future.cancel()
+            yield futures[future], None, f"Timed out after {timeout}s"
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def soup_to_text(soup):
     return '\n'.join(chunk.strip() for line in soup.stripped_strings for chunk in line.split("  "))
 
+def scrape_text(url):
+    page, error = get_page(url)
+    if error: return error
+    return page["text"]
+
 def extract_hyperlinks(soup):
     return [(link.text, link['href']) for link in soup.find_all('a', href=True)]
 
@@ -88,42 +155,66 @@ def format_hyperlinks(hyperlinks):
     return [f"{text} ({url})" for text, url in hyperlinks]
 
 def scrape_links(url):
-    response, error = get_response(url)
+    page, error = get_page(url)
     if error: return error
-    soup = BeautifulSoup(response.text, "html.parser")
-    return format_hyperlinks(extract_hyperlinks(soup))
-
-def split_text(text, max_length=cfg.browse_chunk_max_length):
-    paragraphs, current_chunk = text.split("\n"), []
-    current_length = 0
-    for paragraph in paragraphs:
-        if current_length + len(paragraph) + 1 <= max_length:
-            current_chunk.append(paragraph)
-            current_length += len(paragraph) + 1
-        else:
-            yield "\n".join(current_chunk)
-            current_chunk, current_length = [paragraph], len(paragraph) + 1
-    if current_chunk:
-        yield "\n".join(current_chunk)
+    return format_hyperlinks(page["links"])
+
+def split_text(text, max_tokens=None):
+    return chunk_text(text, max_tokens or cfg.get_int('browse_chunk_tokens'))
 
 def create_message(chunk, question):
     return {"role": "user", "content": f"\"\"\"{chunk}\"\"\" Answer: \"{question}\"."}
 
+def summarize_chunk(chunk, question):
+    return model.create_chat_completion(
+        [create_message(chunk, question)],
+        max_tokens=cfg.browsing_settings['browse_summary_max_token'])
+
+def summarize_chunks(chunks, question):
+    """Map step: summarize chunks on one worker per backend slot, reusing cached summaries."""
+    summaries = summary_cache.get_many(model.model_path, question, chunks)
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=model.parallel_slots()) as executor:
+            for i, summary in zip(missing, executor.map(lambda i: summarize_chunk(chunks[i], question), missing)):
+                summaries[i] = summary
+        summary_cache.put_many(model.model_path, question, [chunks[i] for i in missing], [summaries[i] for i in missing])
+    return summaries
+
+def reduce_summaries(summaries, question):
+    """Reduce step: while the summaries overflow a slot's context, summarize them in groups that fit.
+
+    A single summary already answers the question and is returned as it is.
+    """
+    budget = (model.slot_context_size() - cfg.browsing_settings['browse_summary_max_token']
+              - count_string_tokens(create_message("", question)["content"]) - 64)
+    while len(summaries) > 1:
+        counts = [count_string_tokens(summary) + 1 for summary in summaries]
+        if sum(counts) <= budget:
+            return summarize_chunk("\n".join(summaries), question)
+        groups, used = [[]], 0
+        for summary, num_tokens in zip(summaries, counts):
+            if groups[-1] and used + num_tokens > budget:
+                groups.append([])
+                used = 0
+            groups[-1].append(summary)
+            used += num_tokens
+        if len(groups) == len(summaries):
+            # No two summaries fit together: cut each to half the budget so the next pass can pair them
+            summaries = [next(split_text(summary, max(budget // 2 - 1, 1)), "") for summary in summaries]
+            continue
+        logger.debug(f"Reducing {len(summaries)} summaries in {len(groups)} groups")
+        summaries = summarize_chunks(["\n".join(group) for group in groups], question)
+    return summaries[0] if summaries else "No text to summarize"
+
 def summarize_text(url, text, question):
     if not text: return "No text to summarize"
-    summaries, chunks = [], list(split_text(text))
-    for i, chunk in enumerate(chunks):
-        memory.add(f"Source: {url}\nRaw part#{i + 1}: {chunk}")
-        summary = model.create_completion(
-            create_message(chunk, question), 
-            max_tokens=cfg.browse_summary_max_token, 
-            temperature=cfg.temperature)['choices'][0]['text']
-        summaries.append(summary)
-        memory.add(f"Source: {url}\nSummary part#{i + 1}: {summary}")
-    return model.create_completion(
-        "\n".join(summaries), 
-        max_tokens=cfg.browse_summary_max_token, 
-        temperature=cfg.temperature)['choices'][0]['text']
+    chunks = list(split_text(text))
+    summaries = summarize_chunks(chunks, question)
+    answer = reduce_summaries(summaries, question)
+    memory.add_many([memory_text for i, (chunk, summary) in enumerate(zip(chunks, summaries)) for memory_text in (
+        f"Source: {url}\nRaw part#{i + 1}: {chunk}", f"Source: {url}\nSummary part#{i + 1}: {summary}")])
+    return answer
 
 def evaluate_code(code: str) -> List[str]:
     return call_ai_function(
@@ -148,8 +239,11 @@ def write_tests(code: str, focus: List[str]) -> str:
 
 def ingest_directory(directory, memory, args):
     try:
-        for file in search_files(directory):
-            ingest_file(file, memory, args.max_length, args.overlap)
+        files = [(safe_join(WORKSPACE_FOLDER, file), file) for file in search_files(directory)]
+        report = ingest_files(files, memory, directory or "", args.max_tokens, args.overlap, args.workers)
+        print(f"Ingested {report['ingested']} files, {report['unchanged']} unchanged, {report['removed']} removed from '{directory}'.")
+        if report['errors']:
+            print(f"Ingestion errors in '{directory}': {', '.join(report['errors'])}")
     except Exception as e:
         print(f"Ingestion error in '{directory}': {e}")
 
@@ -201,8 +295,12 @@ def main():
     group.add_argument("--file", type=str, help="File to ingest.")
     group.add_argument("--dir", type=str, help="Directory to ingest.")
     parser.add_argument("--init", action='store_true', help="Init and clear memory.", default=False)
-    parser.add_argument("--overlap", type=int, help="Chunk overlap (default: 200)", default=200)
-    parser.add_argument("--max_length", type=int, help="Chunk max length (default: 4000)", default=4000)
+    parser.add_argument("--overlap", type=int, help=f"Chunk overlap in tokens (default: {cfg.system_settings['ingest_overlap_tokens']})",
+                        default=cfg.system_settings['ingest_overlap_tokens'])
+    parser.add_argument("--max_tokens", type=int, help=f"Chunk size in tokens (default: {cfg.system_settings['ingest_chunk_tokens']})",
+                        default=cfg.system_settings['ingest_chunk_tokens'])
+    parser.add_argument("--workers", type=int, help=f"Processes reading and chunking files (default: {cfg.system_settings['ingest_workers']})",
+                        default=cfg.system_settings['ingest_workers'])
     args = parser.parse_args()
 
     memory = LocalCache(cfg)
@@ -212,7 +310,7 @@ def main():
     
     if args.file:
         try:
-            ingest_file(args.file, memory, args.max_length, args.overlap)
+            ingest_file(args.file, memory, args.max_tokens, args.overlap)
             logger.debug(f"File '{args.file}' ingested.")
         except Exception as e:
             logger.error(f"Ingest error: '{args.file}': {e}")
@@ -0,0 +1,411 @@
+# `.\scripts\memory.py` - In-memory and on-disk storage for the LocalCache memory.
+
+# Imports
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+import numpy as np
+import orjson
+from scripts.utilities_two import logger
+
+# Globals
+INDEX_DTYPE = np.dtype('<u8')  # (offset, length) of each text in the text log
+INDEX_ENTRY_SIZE = 2 * INDEX_DTYPE.itemsize
+TOMB_ENTRY_SIZE = INDEX_DTYPE.itemsize
+QUANTIZED_DTYPES = {'none': np.float32, 'float16': np.float16, 'int8': np.int8}
+SCORE_CHUNK_ROWS = 16384
+QUANTIZED_SCAN_ROWS = 256  # Small enough for each converted chunk to stay in CPU cache
+TOUCH_FLUSH_KEYS = 4096  # Cache hits whose recency is written in one transaction
+
+# Classes
+class EmbeddingBuffer:
+    """Embedding matrix with capacity doubling, so appends are amortized O(1).
+
+    With `quantization` set to float16 or int8 (symmetric, one float32 scale per row) rows are
+    held at 2 or 4 times less memory. Scans decode cache-sized blocks into one reused float32
+    buffer for BLAS and apply int8 scales to the scores, not to the rows. This saves RAM only:
+    the store keeps float32 rows on disk for re-ranking.
+    """
+    def __init__(self, dim: int, initial=None, capacity: int = 1024, quantization: str = 'none'):
+        self.dim = dim
+        self.count = 0
+        self.quantization = quantization
+        self.dtype = QUANTIZED_DTYPES[quantization]
+        initial_rows = 0 if initial is None else len(initial)
+        capacity = max(capacity, initial_rows)
+        self.buffer = np.zeros((capacity, dim), self.dtype)
+        self.scales = np.ones(capacity, np.float32) if quantization == 'int8' else None
+        for start in range(0, initial_rows, SCORE_CHUNK_ROWS):
+            self.append(initial[start:start + SCORE_CHUNK_ROWS])
+
+    def append(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, self.dim)
+        needed = self.count + len(rows)
+        if needed > len(self.buffer):
+            capacity = max(needed, 2 * len(self.buffer))
+            grown = np.zeros((capacity, self.dim), self.dtype)
+            grown[:self.count] = self.buffer[:self.count]
+            self.buffer = grown
+            if self.scales is not None:
+                self.scales = np.concatenate([self.scales[:self.count], np.ones(capacity - self.count, np.float32)])
+        if self.scales is not None:
+            scales = np.abs(rows).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self.scales[self.count:needed] = scales
+            rows = np.rint(rows / scales[:, np.newaxis])
+        self.buffer[self.count:needed] = rows
+        self.count = needed
+
+    def view(self) -> np.ndarray:
+        """The live rows in storage dtype, as a view into the buffer (no copy)."""
+        return self.buffer[:self.count]
+
+    def rows(self, ids=slice(None)) -> np.ndarray:
+        """The selected live rows as float32."""
+        rows = self.view()[ids].astype(np.float32)
+        return rows * self.scales[:self.count][ids, np.newaxis] if self.scales is not None else rows
+
+    def scores(self, query: np.ndarray, ids=None) -> np.ndarray:
+        """Inner products of the query with all live rows, or with the rows in `ids`."""
+        rows = self.view() if ids is None else self.view()[ids]  # A subset is gathered while still quantized
+        if self.quantization == 'none':
+            return rows @ query
+        query = np.asarray(query, dtype=np.float32)
+        scores, block = np.empty(len(rows), np.float32), np.empty((min(QUANTIZED_SCAN_ROWS, len(rows)), self.dim), np.float32)
+        for start in range(0, len(rows), QUANTIZED_SCAN_ROWS):
+            decoded = block[:len(rows[start:start + QUANTIZED_SCAN_ROWS])]
+            np.copyto(decoded, rows[start:start + QUANTIZED_SCAN_ROWS])
+            np.matmul(decoded, query, out=scores[start:start + len(decoded)])
+        if self.scales is not None:
+            scores *= self.scales[:self.count] if ids is None else self.scales[:self.count][ids]
+        return scores
+
+    def clear(self):
+        self.count = 0
+
+    @property
+    def shape(self):
+        return (self.count, self.dim)
+
+    @property
+    def nbytes(self):
+        return self.count * self.buffer.itemsize * self.dim + (self.count * 4 if self.scales is not None else 0)
+
+    def __len__(self):
+        return self.count
+
+class AppendOnlyStore:
+    """Append-only memory store: `.txt` text log, `.idx` offsets index and `.emb` float32 rows.
+
+    Records are written text first, embedding second and index entry last, so the index is the
+    commit record; anything past the last complete index entry is discarded on open. Deleted
+    records stay in place and have their ids appended to the `.tomb` file.
+    """
+    def __init__(self, base_path: str, dim: int):
+        self.base_path = base_path
+        self.dim = dim
+        self.text_file = f"{base_path}.txt"
+        self.index_file = f"{base_path}.idx"
+        self.embedding_file = f"{base_path}.emb"
+        self.tomb_file = f"{base_path}.tomb"
+        self.row_size = dim * np.dtype(np.float32).itemsize
+        self.lock = threading.Lock()
+        for path in (self.text_file, self.index_file, self.embedding_file, self.tomb_file):
+            open(path, 'ab').close()
+        self.count = self._recover()
+
+    def _recover(self) -> int:
+        index = np.fromfile(self.index_file, dtype=INDEX_DTYPE)
+        index = index[:len(index) // 2 * 2].reshape(-1, 2)
+        text_size = os.path.getsize(self.text_file)
+        rows = os.path.getsize(self.embedding_file) // self.row_size
+        count = min(len(index), rows)
+        while count and int(index[count - 1].sum()) > text_size:
+            count -= 1
+        text_end = int(index[count - 1].sum()) if count else 0
+        if (count, text_end) != (len(index), text_size) or rows != count:
+            logger.warn(f"Memory store {self.base_path}: recovered {count} records, discarding partial writes.")
+        tomb_size = os.path.getsize(self.tomb_file) // TOMB_ENTRY_SIZE * TOMB_ENTRY_SIZE
+        for path, size in ((self.index_file, count * INDEX_ENTRY_SIZE), (self.text_file, text_end), (self.embedding_file, count * self.row_size), (self.tomb_file, tomb_size)):
+            if os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        return count
+
+    def read_texts(self) -> List[str]:
+        if not self.count:
+            return []
+        index = np.fromfile(self.index_file, dtype=INDEX_DTYPE, count=self.count * 2).reshape(-1, 2)
+        with open(self.text_file, 'rb') as f:
+            blob = f.read()
+        return [blob[offset:offset + length].decode('utf-8') for offset, length in index.tolist()]
+
+    def read_embeddings(self) -> np.ndarray:
+        if not self.count:
+            return np.zeros((0, self.dim), np.float32)
+        return np.memmap(self.embedding_file, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+
+    def read_rows(self, ids: np.ndarray) -> np.ndarray:
+        """Full-precision rows from disk, used to re-rank candidates found on quantized rows."""
+        return np.asarray(self.read_embeddings()[ids])
+
+    def append(self, texts: List[str], embeddings: np.ndarray) -> List[int]:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if len(texts) != len(embeddings):
+            raise ValueError(f"Got {len(texts)} texts for {len(embeddings)} embeddings")
+        encoded = [text.encode('utf-8') for text in texts]
+        with self.lock:
+            offset = os.path.getsize(self.text_file)
+            index = np.zeros((len(encoded), 2), dtype=INDEX_DTYPE)
+            for i, data in enumerate(encoded):
+                index[i] = (offset, len(data))
+                offset += len(data)
+            for path, payload in ((self.text_file, b"".join(encoded)), (self.embedding_file, embeddings.tobytes()), (self.index_file, index.tobytes())):
+                with open(path, 'ab') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+            ids = list(range(self.count, self.count + len(encoded)))
+            self.count += len(encoded)
+        return ids
+
+    def read_tombstones(self) -> np.ndarray:
+        return np.fromfile(self.tomb_file, dtype=INDEX_DTYPE)
+
+    def delete(self, ids: List[int]):
+        with self.lock:
+            with open(self.tomb_file, 'ab') as f:
+                f.write(np.asarray(ids, dtype=INDEX_DTYPE).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def clear(self):
+        with self.lock:
+            for path in (self.index_file, self.text_file, self.embedding_file, self.tomb_file):
+                open(path, 'wb').close()
+            self.count = 0
+
+class ExactIndex:
+    """Brute-force inner product over every live row."""
+    def __init__(self, embeddings: EmbeddingBuffer):
+        self.embeddings = embeddings
+
+    def add(self, ids: List[int], rows: np.ndarray):
+        pass
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        return top_k(self.embeddings.scores(query), k)
+
+    def clear(self):
+        pass
+
+class IVFFlatIndex:
+    """Inverted-file index: rows are bucketed by nearest k-means centroid and only the `nprobe`
+    closest buckets are scanned. Centroids are retrained whenever the row count doubles."""
+    def __init__(self, embeddings: EmbeddingBuffer, nprobe: int = 8, min_train_rows: int = 1024):
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.clear()
+
+    def add(self, ids: List[int], rows: np.ndarray):
+        if len(self.embeddings) >= max(self.min_train_rows, 2 * self.trained_rows):
+            self._train()
+        elif self.centroids is not None:
+            for list_id, row_id in zip(np.argmax(rows @ self.centroids.T, axis=1).tolist(), ids):
+                self.lists[list_id].append(row_id)
+                self.list_arrays.pop(list_id, None)
+
+    def _train(self, iterations: int = 10):
+        num_rows = len(self.embeddings)
+        nlist = max(1, int(2 * math.sqrt(num_rows)))
+        rng = np.random.default_rng(0)
+        sample = self.embeddings.rows(np.sort(rng.choice(num_rows, min(num_rows, 32 * nlist), replace=False)))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assignment, minlength=nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            centroids[counts > 0] = np.add.reduceat(sample[np.argsort(assignment, kind='stable')], starts[counts > 0], axis=0)
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+        self.centroids = centroids
+        self.lists = [[] for _ in range(nlist)]
+        self.list_arrays = {}
+        for start in range(0, num_rows, SCORE_CHUNK_ROWS):
+            for offset, list_id in enumerate(np.argmax(self.embeddings.rows(slice(start, start + SCORE_CHUNK_ROWS)) @ centroids.T, axis=1).tolist()):
+                self.lists[list_id].append(start + offset)
+        self.trained_rows = num_rows
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        if self.centroids is None:
+            return top_k(self.embeddings.scores(query), k)
+        probes = top_k(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([self._list_array(list_id) for list_id in probes.tolist()])
+        return candidates[top_k(self.embeddings.scores(query, candidates), k)]
+
+    def _list_array(self, list_id):
+        if list_id not in self.list_arrays:
+            self.list_arrays[list_id] = np.array(self.lists[list_id], dtype=np.int64)
+        return self.list_arrays[list_id]
+
+    def clear(self):
+        self.centroids, self.lists, self.list_arrays, self.trained_rows = None, [], {}, 0
+
+class HNSWLibIndex:
+    """Graph index backed by the optional `hnswlib` package."""
+    def __init__(self, embeddings: EmbeddingBuffer, ef: int = 64):
+        import hnswlib
+        self.hnswlib = hnswlib
+        self.embeddings = embeddings
+        self.ef = ef
+        self.clear()
+
+    def add(self, ids: List[int], rows: np.ndarray):
+        if not len(ids):
+            return
+        if self.index.get_current_count() + len(ids) > self.index.get_max_elements():
+            self.index.resize_index(max(2 * self.index.get_max_elements(), self.index.get_current_count() + len(ids)))
+        self.index.add_items(rows, ids)
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, self.index.get_current_count())
+        if not k:
+            return np.zeros(0, dtype=np.int64)
+        self.index.set_ef(max(self.ef, k))
+        return self.index.knn_query(query, k)[0][0].astype(np.int64)
+
+    def clear(self):
+        self.index = self.hnswlib.Index(space='ip', dim=self.embeddings.dim)
+        self.index.init_index(max_elements=1024, ef_construction=200, M=16)
+
+class FaissIndex:
+    """HNSW graph index backed by the optional `faiss` package."""
+    def __init__(self, embeddings: EmbeddingBuffer, ef: int = 64):
+        import faiss
+        self.faiss = faiss
+        self.embeddings = embeddings
+        self.ef = ef
+        self.clear()
+
+    def add(self, ids: List[int], rows: np.ndarray):
+        if len(ids):
+            self.index.add(np.ascontiguousarray(rows, dtype=np.float32))
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, self.index.ntotal)
+        if not k:
+            return np.zeros(0, dtype=np.int64)
+        self.index.hnsw.efSearch = max(self.ef, k)
+        return self.index.search(np.ascontiguousarray(query, dtype=np.float32)[np.newaxis, :], k)[1][0]
+
+    def clear(self):
+        self.index = self.faiss.IndexHNSWFlat(self.embeddings.dim, 32, self.faiss.METRIC_INNER_PRODUCT)
+
+class EmbeddingCache:
+    """Persistent LRU of embeddings keyed on (model path, hash of whitespace-normalized text).
+
+    Lookups only read; the recency of hits is kept in memory and written in batches, before eviction and on close.
+    """
+    def __init__(self, path: str, max_entries: int = 50000):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, last_used INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.clock = self.conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()[0]
+        self.touched = {}  # key -> clock of hits not yet written
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(model_path: str, text: str) -> str:
+        return hashlib.sha256(f"{model_path}\0{' '.join(text.split())}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model_path: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self.key(model_path, text) for text in texts]
+        with self.lock:
+            found = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                found.update(self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch).fetchall())
+            self.clock += 1
+            self.touched.update(dict.fromkeys(found, self.clock))
+            if len(self.touched) >= TOUCH_FLUSH_KEYS:
+                self._write_touched()
+                self.conn.commit()
+            hits = sum(key in found for key in keys)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(keys) - hits
+        return [np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys]
+
+    def put_many(self, model_path: str, texts: List[str], vectors: List[List[float]]):
+        with self.lock:
+            self._write_touched()  # So eviction sees recent hits
+            self.clock += 1
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", [
+                (self.key(model_path, text), np.asarray(vector, dtype=np.float32).tobytes(), self.clock) for text, vector in zip(texts, vectors)])
+            excess = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,))
+            self.conn.commit()
+
+    def _write_touched(self):
+        if self.touched:
+            self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(clock, key) for key, clock in self.touched.items()])
+            self.touched.clear()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self._write_touched()
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {**self.stats, 'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                    'entries': self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]}
+
+# Functions
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, via argpartition instead of a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind='stable')]
+
+def create_index(memory_backend: str, embeddings: EmbeddingBuffer, system_settings: dict):
+    """Index for `memory_backend`: local (exact), local_ivf, local_hnsw (hnswlib) or local_faiss."""
+    try:
+        if memory_backend == 'local_ivf':
+            return IVFFlatIndex(embeddings, nprobe=system_settings['memory_ivf_nprobe'])
+        if memory_backend == 'local_hnsw':
+            return HNSWLibIndex(embeddings, ef=system_settings['memory_hnsw_ef'])
+        if memory_backend == 'local_faiss':
+            return FaissIndex(embeddings, ef=system_settings['memory_hnsw_ef'])
+    except ImportError as e:
+        logger.warn(f"Memory backend '{memory_backend}' unavailable ({e}), using exact search.")
+    return ExactIndex(embeddings)
+
+def migrate_json_cache(json_path: str, store: AppendOnlyStore) -> int:
+    """One-shot import of a legacy `<memory_index>.json` cache into an empty store."""
+    if not os.path.exists(json_path) or store.count:
+        return 0
+    try:
+        with open(json_path, 'rb') as f:
+            content = orjson.loads(f.read() or b'{}')
+    except orjson.JSONDecodeError:
+        logger.error(f"Error: {json_path} not JSON, skipping migration.")
+        return 0
+    texts = content.get('texts', [])
+    embeddings = np.array(content.get('embeddings', []), np.float32).reshape(-1, store.dim)
+    store.append(texts, embeddings)
+    os.replace(json_path, f"{json_path}.migrated")
+    logger.debug(f"Migrated {len(texts)} memories from {json_path}")
+    return len(texts)
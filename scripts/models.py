@@ -1,14 +1,148 @@
 # `.\scripts\models.py`
 
 # Imports
-import subprocess, os, math, json, re
-from typing import List, Dict, Any, Union
-from scripts.config import Config
-import tiktoken
+import subprocess, os, math, json, re, time, atexit, codecs, hashlib, threading, functools
+from typing import List, Dict, Any, Union, Iterator
+from scripts.config import get_config
+import requests
 from scripts.utilities_two import logger
+from scripts.tokenizer import get_token_counter
+from scripts.tracing import annotate, span
 
 # Global Config
-cfg = Config()
+cfg = get_config()
+LLAMA_BINARIES = ".\\data\\libraries\\LlamaCpp_Binaries"
+SERVER_PORT_OFFSETS = {'chat': 0, 'code': 1, 'embed': 2}
+EMBED_SEPARATOR = "<#embd-sep#>"
+model_servers = {}
+
+class PromptCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'prefill_tokens_saved': 0, 'prefill_tokens_evaluated': 0}
+
+    @staticmethod
+    def prefix_key(model_path, prefix):
+        return hashlib.sha1(f"{model_path}\n{prefix}".encode('utf-8')).hexdigest()[:16]
+
+    def session_file(self, model_path, prefix):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, f"{self.prefix_key(model_path, prefix)}.bin")
+
+    def record(self, tokens_saved, tokens_evaluated):
+        with self.lock:
+            self.stats['hits' if tokens_saved > 0 else 'misses'] += 1
+            self.stats['prefill_tokens_saved'] += tokens_saved
+            self.stats['prefill_tokens_evaluated'] += tokens_evaluated
+        logger.debug(f"Prompt cache {'hit' if tokens_saved > 0 else 'miss'}: reused {tokens_saved} tokens, evaluated {tokens_evaluated}")
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+prompt_cache = PromptCache(os.path.join("cache", "prompt_cache"))
+
+class LlamaServer:
+    def __init__(self, model_type, model_path, n_threads, embedding=False):
+        self.model_type = model_type
+        self.model_path = model_path
+        self.n_threads = n_threads
+        self.embedding = embedding  # llama-server started with --embedding serves embeddings only, not completions
+        self.host = cfg.llm_model_settings['server_host']
+        self.port = cfg.llm_model_settings['server_port'] + SERVER_PORT_OFFSETS.get(model_type, 0)
+        self.base_url = f"http://{self.host}:{self.port}"
+        self.process = None
+        self.session = requests.Session()
+
+    def start(self):
+        # llama-server splits --ctx_size between its slots, so each slot is given the full context_size
+        slots = 1 if self.embedding else cfg.llm_model_settings['server_parallel_slots']
+        cmd = [
+            os.path.join(LLAMA_BINARIES, "llama-server.exe"),
+            "-m", self.model_path, "--host", self.host, "--port", str(self.port),
+            "-t", str(self.n_threads), "--ctx_size", str(cfg.llm_model_settings['context_size'] * slots), "-ngl", "1"
+        ]
+        cmd += ["--embedding"] if self.embedding else ["--parallel", str(slots)]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + cfg.llm_model_settings['server_startup_timeout']
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Llama Server for {self.model_type} exited with code {self.process.returncode}")
+            if self.is_healthy():
+                logger.debug(f"Llama Server for {self.model_type} ready on {self.base_url}")
+                return
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"Llama Server for {self.model_type} not healthy after {cfg.llm_model_settings['server_startup_timeout']}s")
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def is_healthy(self):
+        if not self.is_running():
+            return False
+        try:
+            return self.session.get(f"{self.base_url}/health", timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def completion(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        return "".join(self.stream_completion(prompt, max_tokens, temperature))
+
+    def stream_completion(self, prompt: str, max_tokens: int, temperature: float, prefix_key: str = None) -> Iterator[str]:
+        # Timings on every chunk, so prefill counts arrive with the first token rather than only with the last
+        payload = {"prompt": prompt, "n_predict": max_tokens, "temperature": temperature, "stream": True, "timings_per_token": True}
+        if prefix_key:
+            # Pin each stable prefix to one slot so its KV cache survives between calls
+            payload['cache_prompt'] = True
+            payload['id_slot'] = int(prefix_key, 16) % cfg.llm_model_settings['server_parallel_slots']
+        with self.session.post(f"{self.base_url}/completion", json=payload, stream=True, timeout=None) as response:
+            if response.status_code != 200:
+                # An HTTPError is a RequestException, so callers fall back to the CLI
+                raise requests.exceptions.HTTPError(f"Llama Server Error: HTTP {response.status_code} {response.text}", response=response)
+            # The caller may close the stream as soon as its JSON is complete, so stats are taken
+            # from the first chunk that has them, and the timings seen last are annotated on close
+            recorded, timings = not prefix_key, None
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data: "):
+                        continue
+                    chunk = json.loads(line[len("data: "):])
+                    timings = chunk.get('timings', timings)
+                    if not recorded and timings is not None and ('cache_n' in timings or 'tokens_evaluated' in chunk):
+                        evaluated = timings.get('prompt_n', 0)
+                        prompt_cache.record(timings['cache_n'] if 'cache_n' in timings else max(chunk['tokens_evaluated'] - evaluated, 0), evaluated)
+                        recorded = True
+                    if chunk.get("content"):
+                        yield chunk["content"]
+                    if chunk.get("stop"):
+                        break
+            finally:
+                if timings is not None:
+                    annotate(server_timings={key: timings.get(key) for key in ('prompt_n', 'prompt_ms', 'predicted_n', 'predicted_ms')})
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.session.post(f"{self.base_url}/embedding", json={"content": texts}, timeout=None)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(f"Llama Server Error: HTTP {response.status_code} {response.text}", response=response)
+        results = response.json()
+        results = results.get("results", [results]) if isinstance(results, dict) else results
+        return [result["embedding"] for result in results]
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        logger.debug(f"Llama Server for {self.model_type} stopped")
+        self.process = None
+        self.session.close()
 
 class LlamaModel:
     def __init__(self, model_type):
@@ -36,21 +170,196 @@ class LlamaModel:
         total_threads = os.cpu_count() or 4
         return math.ceil((total_threads / 100) * 85)
 
+    def parallel_slots(self) -> int:
+        """Completions the backend can run at once: the server's slots, or 1 for the CLI."""
+        server = model_servers.get(self.model_type)
+        return cfg.llm_model_settings['server_parallel_slots'] if server is not None and server.is_running() else 1
+
+    def slot_context_size(self) -> int:
+        """Context one completion gets: each server slot and each CLI run has context_size tokens."""
+        return cfg.llm_model_settings['context_size']
+
     def run_llama_cli(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        return "".join(self.stream_llama_cli(prompt, max_tokens, temperature))
+
+    def stream_llama_cli(self, prompt: str, max_tokens: int, temperature: float, session_file: str = None) -> Iterator[str]:
         cmd = [
-            ".\\data\\libraries\\LlamaCpp_Binaries\\llama-cli.exe",
-            "-m", self.model_path, "-p", prompt, "--temp", str(temperature),
+            os.path.join(LLAMA_BINARIES, "llama-cli.exe"),
+            "-m", self.model_path, "-p", prompt, "--temp", str(temperature), "--no-display-prompt",
             "-n", str(max_tokens), "-t", str(self.n_threads), "--ctx_size", str(cfg.llm_model_settings['context_size']), "-ngl", "1"
         ]
+        if session_file:
+            cmd += ["--prompt-cache", session_file]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stderr_lines, session_checked = [], threading.Event()
+
+        def read_stderr():
+            with process.stderr:
+                for line in iter(process.stderr.readline, b""):
+                    line = line.decode('utf-8', errors='replace')
+                    stderr_lines.append(line)
+                    if "session file" in line:
+                        session_checked.set()
+            session_checked.set()
+
+        reader = threading.Thread(target=read_stderr, name="llama-cli-stderr", daemon=True)
+        reader.start()
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        recorded = not session_file
+        try:
+            while True:
+                data = process.stdout.read1(256)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    if not recorded:
+                        # Before the first yield, as the caller may close the stream at any token
+                        session_checked.wait(1)
+                        prompt_cache.record(*self.session_match(prompt, "".join(stderr_lines)))
+                        recorded = True
+                    yield text
+            if process.wait() != 0:
+                reader.join()
+                error = "".join(stderr_lines)
+                logger.error(f"Llama CLI Error: {error}")
+                raise RuntimeError(f"Failed to execute Llama CLI: {error}")
+            if not recorded:
+                reader.join()
+                prompt_cache.record(*self.session_match(prompt, "".join(stderr_lines)))
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            reader.join(5)
+            process.stdout.close()
+
+    def session_match(self, prompt: str, log: str) -> tuple:
+        """(tokens reused, tokens evaluated) from llama-cli's --prompt-cache log lines."""
+        match = re.search(r"session file (?:matches |has low similarity to prompt \()(\d+) / (\d+) tokens", log)
+        if match:
+            saved, total = int(match.group(1)), int(match.group(2))
+            return saved, total - saved
+        total = get_token_counter(self.model_path).count(prompt)
+        if "session file has exact match" in log:
+            return total, 0
+        return 0, total
+
+    def create_chat_completion(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None) -> str:
+        return "".join(self.stream_chat_completion(messages, temperature, max_tokens))
+
+    def stream_chat_completion(self, messages: List[Dict[str, str]], temperature: float = None, max_tokens: int = None) -> Iterator[str]:
+        prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        # Read at call time so a temperature changed in the menus applies to the next completion
+        temperature = cfg.get_float('temperature') if temperature is None else temperature
+        max_tokens = max_tokens or cfg.get_int('max_tokens')
+        # The leading system prompt (constraints and command list) is the stable, cacheable prefix
+        prefix = f"{messages[0]['role']}: {messages[0]['content']}" if messages and messages[0]['role'] == 'system' else None
+        use_cache = prefix is not None and cfg.llm_model_settings['prompt_cache']
+        server = model_servers.get(self.model_type)
+        if server is not None and server.is_running():
+            started = False
+            prefix_key = PromptCache.prefix_key(self.model_path, prefix) if use_cache else None
+            try:
+                for token in server.stream_completion(prompt, max_tokens, temperature, prefix_key):
+                    started = True
+                    yield token
+                return
+            except requests.exceptions.RequestException as e:
+                if started:
+                    raise
+                logger.warn(f"Llama Server for {self.model_type} unavailable, falling back to Llama CLI: {e}")
+        session_file = prompt_cache.session_file(self.model_path, prefix) if use_cache else None
+        yield from self.stream_llama_cli(prompt, max_tokens, temperature, session_file)
+
+    def run_llama_embedding(self, texts: List[str]) -> List[List[float]]:
+        cmd = [
+            os.path.join(LLAMA_BINARIES, "llama-embedding.exe"),
+            "-m", self.model_path, "-p", EMBED_SEPARATOR.join(texts), "--embd-separator", EMBED_SEPARATOR,
+            "--embd-output-format", "array", "-t", str(self.n_threads), "--ctx_size", str(cfg.llm_model_settings['context_size']), "-ngl", "1"
+        ]
         result = subprocess.run(cmd, capture_output=True, text=True)
         if result.returncode != 0:
-            logger.error(f"Llama CLI Error: {result.stderr}")
-            raise RuntimeError(f"Failed to execute Llama CLI: {result.stderr}")
-        return result.stdout
+            logger.error(f"Llama Embedding Error: {result.stderr}")
+            raise RuntimeError(f"Failed to execute Llama Embedding: {result.stderr}")
+        return json.loads(result.stdout)
 
-    def create_chat_completion(self, messages: List[Dict[str, str]], temperature: float = cfg.llm_model_settings['temperature'], max_tokens: int = None) -> str:
-        prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-        return self.run_llama_cli(prompt, max_tokens or cfg.llm_model_settings['max_tokens'], temperature)
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        batch_size = cfg.llm_model_settings['embed_batch_size']
+        server = model_servers.get('embed')
+        if server is not None and server.model_path != self.model_path:
+            server = None
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            if server is not None and server.is_running():
+                try:
+                    embeddings.extend(server.embed(batch))
+                    continue
+                except requests.exceptions.RequestException as e:
+                    logger.warn(f"Llama Server for embeddings unavailable, falling back to Llama Embedding: {e}")
+            embeddings.extend(self.run_llama_embedding(batch))
+        return embeddings
+
+def start_model_servers(model_types=('chat', 'code', 'embed')):
+    """Start a llama-server per model type; 'embed' is a separate embeddings-only server for the chat model."""
+    if cfg.llm_model_settings['llm_backend'] != 'server':
+        logger.debug("Llama backend set to CLI, not starting servers.")
+        return model_servers
+    for model_type in model_types:
+        if model_type == 'embed' and not cfg.llm_model_settings['embedding_server']:
+            continue
+        if model_type in model_servers:
+            if model_servers[model_type].is_healthy():
+                continue
+            model_servers.pop(model_type).stop()
+        model = LlamaModel('chat' if model_type == 'embed' else model_type)
+        server = LlamaServer(model_type, model.model_path, model.n_threads, embedding=model_type == 'embed')
+        try:
+            server.start()
+            model_servers[model_type] = server
+        except (OSError, RuntimeError) as e:
+            logger.error(f"Llama Server for {model_type} failed to start, using Llama CLI: {e}")
+    return model_servers
+
+def get_prompt_cache_stats():
+    return prompt_cache.get_stats()
+
+def stop_model_servers():
+    while model_servers:
+        _, server = model_servers.popitem()
+        server.stop()
+
+atexit.register(stop_model_servers)
+
+class JsonStreamScanner:
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> int:
+        """Return the index just past the brace closing the top-level object, or -1."""
+        for i, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth > 0:
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return -1
 
 class JsonHandler:
     @staticmethod
@@ -58,7 +367,8 @@ class JsonHandler:
         try:
             return json.loads(json_str.replace('\t', ''))
         except json.JSONDecodeError:
-            return json.loads(JsonHandler.correct_json(json_str))
+            with span("json.repair"):
+                return json.loads(JsonHandler.correct_json(json_str))
 
     @staticmethod
     def correct_json(json_str: str) -> str:
@@ -70,29 +380,43 @@ class JsonHandler:
 
     @staticmethod
     def get_command(response: str) -> tuple:
+        return JsonHandler.get_commands(response)[0]
+
+    @staticmethod
+    def get_commands(response: str) -> List[tuple]:
+        """(name, args) for each entry of a "commands" list, or for the single "command" object."""
         try:
-            response_json = JsonHandler.fix_and_parse_json(response)
-            if "command" not in response_json:
-                return "Error", "Missing 'command' object"
-            command = response_json["command"]
-            return command.get("name", "Error"), command.get("args", {})
+            with span("json.parse"):
+                response_json = JsonHandler.fix_and_parse_json(response)
+            commands = response_json.get("commands")
+            if not commands and "command" in response_json:
+                commands = [response_json["command"]]
+            if not commands or not isinstance(commands, list):
+                return [("Error", "Missing 'command' object")]
+            return [(command.get("name", "Error"), command.get("args", {})) if isinstance(command, dict) else ("Error", f"Invalid command: {command}")
+                    for command in commands]
         except json.JSONDecodeError:
-            return "Error", "Invalid JSON"
+            return [("Error", "Invalid JSON")]
         except Exception as e:
-            return "Error", str(e)
+            return [("Error", str(e))]
 
-def count_message_tokens(messages: List[Dict[str, str]], model: str = "gpt-3.5-turbo-0301") -> int:
+@functools.lru_cache(maxsize=None)
+def get_chat_token_counter():
     try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    tokens_per_message, tokens_per_name = (4, -1) if model == "gpt-3.5-turbo-0301" else (3, 1)
-    num_tokens = 3 + sum(tokens_per_message + sum(len(encoding.encode(value)) + (tokens_per_name if key == "name" else 0) for key, value in msg.items()) for msg in messages)
-    return num_tokens
-
-def count_string_tokens(string: str, model_name: str) -> int:
-    encoding = tiktoken.encoding_for_model(model_name)
-    return len(encoding.encode(string))
+        model_path = LlamaModel('chat').model_path
+    except OSError:
+        model_path = None
+    return get_token_counter(model_path)
+
+def count_tokens_per_message(messages: List[Dict[str, str]]) -> List[int]:
+    # Messages are sent as "role: content" lines, so count exactly that plus the joining newline
+    return [num_tokens + 1 for num_tokens in get_chat_token_counter().count_many([f"{msg['role']}: {msg['content']}" for msg in messages])]
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens_per_message(messages))
+
+def count_string_tokens(string: str) -> int:
+    return get_chat_token_counter().count(string)
 
 def call_ai_function(function, args, description, model=None):
     model = model or cfg.llm_model_settings['smart_llm_model']
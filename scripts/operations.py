@@ -1,16 +1,24 @@
 # `.\scripts\operations.py`
 
 # Imports
-import json, datetime, os, subprocess
-from scripts.config import Config
-from scripts.utilities_one import LocalCache, logger
-from scripts.models import JsonHandler
-from playwright.sync_api import sync_playwright
+import contextvars, json, datetime, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from scripts.config import get_config
+from scripts.utilities_one import LocalCache, get_memory, logger, read_python_exe_path
+from scripts.models import JsonHandler, LlamaModel, call_ai_function
+from scripts.browser import browser_pool
+from scripts.chunking import chunk_lines
+from scripts.ingestion import ingest_files
+from scripts.jobs import job_registry, run_or_background
+from scripts.tracing import annotate, span
 
 # Global Config
-cfg = Config()
-WORKSPACE_FOLDER = ".\\cache\\workspace"
+cfg = get_config()
+WORKSPACE_FOLDER = os.path.join("cache", "workspace")
 os.makedirs(WORKSPACE_FOLDER, exist_ok=True)
+# Playwright's sync API is bound to the thread that started it, and task_complete quits the process
+AGENT_THREAD_COMMANDS = {"web_search", "browse_website", "get_text_summary", "get_hyperlinks", "task_complete"}
 
 def is_valid_int(value):
     try:
@@ -31,7 +39,7 @@ def execute_command(command_name, arguments):
     command_map = {
         "web_search": web_search,
         "browse_website": browse_website,
-        "memory_add": lambda args: memory.add(args["string"]),
+        "memory_add": lambda string: get_memory(cfg).add(string),
         "start_agent": start_agent,
         "message_agent": message_agent,
         "list_agents": list_agents,
@@ -48,85 +56,113 @@ def execute_command(command_name, arguments):
         "write_tests": write_tests,
         "execute_python_file": execute_python_file,
         "execute_shell": execute_shell,
-        "generate_image": generate_image,
-        "do_nothing": lambda _: "No action performed.",
-        "task_complete": shutdown,
+        "start_job": start_job,
+        "poll_job": poll_job,
+        "kill_job": kill_job,
+        "do_nothing": lambda: "No action performed.",
+        "task_complete": lambda reason="": shutdown(),
     }
     
-    try:
-        if command_name in command_map:
-            return command_map[command_name](arguments)
-        return f"Unknown command '{command_name}'."
-    except Exception as e:
-        logger.error(f"Error executing command {command_name}: {str(e)}")
-        return f"Error executing command '{command_name}': {str(e)}. Please check your input or consult documentation."
+    start = time.perf_counter()
+    with span("command", command=command_name):
+        try:
+            if command_name in command_map:
+                return command_map[command_name](**(arguments or {}))
+            return f"Unknown command '{command_name}'."
+        except Exception as e:
+            logger.error(f"Error executing command {command_name}: {str(e)}")
+            annotate(error=f"{type(e).__name__}: {e}")
+            return f"Error executing command '{command_name}': {str(e)}. Please check your input or consult documentation."
+        finally:
+            logger.debug(f"Command {command_name} took {time.perf_counter() - start:.2f}s")
+
+def execute_commands(commands: List[Tuple[str, dict]]) -> List[str]:
+    """Run independent commands from one reply, up to `command_parallelism` at once; results come back in order.
+
+    Browsing commands run on this thread, after the others have been submitted, and task_complete last of all.
+    """
+    results = [None] * len(commands)
+    pooled = [i for i, (name, _) in enumerate(commands) if name not in AGENT_THREAD_COMMANDS]
+    workers = min(cfg.get_int('command_parallelism'), len(pooled))
+    if workers < 2:
+        pooled, workers = [], 1  # Nothing to overlap, so everything runs here
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command") as executor:
+        # Each command gets a copy of this context, so its span is a child of the agent step
+        futures = {i: executor.submit(contextvars.copy_context().run, execute_command, *commands[i]) for i in pooled}
+        local = sorted(set(range(len(commands))) - set(pooled), key=lambda i: commands[i][0] == "task_complete")
+        for i in local:
+            if commands[i][0] == "task_complete":
+                for future in futures.values():
+                    future.result()
+            results[i] = execute_command(*commands[i])
+        for i, future in futures.items():
+            results[i] = future.result()
+    return results
 
 def get_datetime():
     return "Current date/time: " + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 def web_search(query):
-    logger.info(f"Starting web search for query: {query}")
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=cfg.browsing_settings['playwright_headless'])
-        page = browser.new_page()
-        try:
+    logger.debug(f"Starting web search for query: {query}")
+    try:
+        with browser_pool.page() as page:
             page.goto("https://duckduckgo.com/")
             page.fill('input[name="q"]', query)
             page.press('input[name="q"]', 'Enter')
             page.wait_for_selector('.result__body')
-            results = page.evaluate("""
+            return page.evaluate("""
                 () => Array.from(document.querySelectorAll('.result__body')).map(result => ({
                     title: result.querySelector('.result__title').innerText,
                     snippet: result.querySelector('.result__snippet').innerText,
                     url: result.querySelector('.result__url').href
                 })).slice(0, 5)
             """)
-            browser.close()
-            return results
-        except Exception as e:
-            browser.close()
-            logger.error(f"Web search failed for query '{query}': {str(e)}")
-            return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Web search failed for query '{query}': {str(e)}")
+        return {"error": str(e)}
+
+def render_page(url):
+    with browser_pool.page() as page:
+        page.goto(url)
+        page.wait_for_load_state("networkidle")
+        content = page.evaluate("""
+            () => {
+                const article = document.querySelector('article');
+                if (article) return article.innerText;
+                const main = document.querySelector('main');
+                if (main) return main.innerText;
+                return document.body.innerText;
+            }
+        """)
+        links = page.evaluate("""
+            () => Array.from(document.links).map(link => ({
+                href: link.href,
+                text: link.textContent.trim()
+            })).filter(link => link.text && link.href.startsWith('http'))
+        """)
+    return {"text": content, "links": links}
 
 def browse_website(url, question):
-    logger.info(f"Browsing website {url} for question: {question}")
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=cfg.browsing_settings['playwright_headless'])
-        page = browser.new_page()
-        try:
-            page.goto(url, timeout=cfg.browsing_settings['playwright_timeout'])
-            page.wait_for_load_state("networkidle", timeout=cfg.browsing_settings['playwright_timeout'])
-            content = page.evaluate("""
-                () => {
-                    const article = document.querySelector('article');
-                    if (article) return article.innerText;
-                    const main = document.querySelector('main');
-                    if (main) return main.innerText;
-                    return document.body.innerText;
-                }
-            """)
-            links = page.evaluate("""
-                () => Array.from(document.links).map(link => ({
-                    href: link.href,
-                    text: link.textContent.trim()
-                })).filter(link => link.text && link.href.startsWith('http'))
-            """)
-            browser.close()
-            summary = summarize_text(content, question)
-            return {
-                "summary": summary,
-                "links": links[:5]
-            }
-        except Exception as e:
-            browser.close()
-            logger.error(f"Browsing failed for URL '{url}': {str(e)}")
-            return {"error": str(e)}
+    from scripts.management import page_cache, page_cache_key, summarize_text
+    logger.debug(f"Browsing website {url} for question: {question}")
+    try:
+        page = page_cache.get(page_cache_key(url), lambda headers: render_page(url), kind="browser")
+        summary = summarize_text(url, page["text"], question)
+        return {
+            "summary": summary,
+            "links": page["links"][:5]
+        }
+    except Exception as e:
+        logger.error(f"Browsing failed for URL '{url}': {str(e)}")
+        return {"error": str(e)}
 
 def get_text_summary(url, question):
+    from scripts.management import scrape_text, summarize_text
     text = scrape_text(url)
     return "Result: " + summarize_text(url, text, question)
 
 def get_hyperlinks(url):
+    from scripts.management import scrape_links
     return scrape_links(url)
 
 def commit_memory(string):
@@ -152,7 +188,7 @@ def shutdown():
     print("Shutting down...")
     quit()
 
-def start_agent(name, task, prompt, model=cfg.fast_llm_model):
+def start_agent(name, task, prompt, model=None):
     key, ack = agents.create_agent(task, f"You are {name}. Acknowledged.", model)
     return f"Agent {name} created with key {key}. First response: {message_agent(key, prompt)}"
 
@@ -175,58 +211,69 @@ def safe_join(base, *paths):
     return new_path
 
 def execute_shell(command_line):
-    """Run shell command."""
-    initial_dir = os.getcwd()
-    try:
-        os.chdir(WORKSPACE_FOLDER)
-        result = subprocess.run(command_line, capture_output=True, shell=True)
-        os.chdir(initial_dir)
-        return f"STDOUT:\n{result.stdout}\nSTDERR:\n{result.stderr}"
-    except Exception as e:
-        os.chdir(initial_dir)
-        logger.error(f"Error executing shell command '{command_line}': {str(e)}")
-        return f"Error executing shell command: {str(e)}"
+    """Run shell command in the workspace, as a background job if it outlives `command_wait`."""
+    return run_or_background(command_line, shell=True, cwd=WORKSPACE_FOLDER)
 
 def execute_python_file(file):
-    """Run a Python file."""
+    """Run a Python file, as a background job if it outlives `command_wait`."""
     if not file.endswith(".py"):
         return "Error: Only .py files."
-    file_path = os.path.join(WORKSPACE_FOLDER, file)
-    if not os.path.isfile(file_path):
-        return f"Error: File '{file}' not found."
     try:
-        result = subprocess.run(['python', file_path], capture_output=True, text=True)
-        return result.stdout if result.returncode == 0 else f"Error: {result.stderr}"
-    except Exception as e:
+        file_path = safe_join(WORKSPACE_FOLDER, file)
+    except ValueError as e:
         return f"Error: {str(e)}"
+    if not os.path.isfile(file_path):
+        return f"Error: File '{file}' not found."
+    return run_or_background([read_python_exe_path() or sys.executable, os.path.abspath(file_path)], cwd=WORKSPACE_FOLDER)
 
-def split_file(content, max_length=4000, overlap=0):
-    """Split text into chunks."""
-    for start in range(0, len(content), max_length - overlap):
-        yield content[start:start + max_length]
-
-def read_file(filename):
+def start_job(command_line):
+    """Start a shell command in the workspace without waiting for it."""
+    try:
+        job = job_registry.start(command_line, shell=True, cwd=WORKSPACE_FOLDER)
+    except (OSError, RuntimeError) as e:
+        return f"Error starting job: {str(e)}"
+    return f"Started job {job.id}: {job.command}. Use poll_job to read its output."
+
+def poll_job(job_id):
+    """Status of a job and the output it wrote since the last poll."""
+    job = job_registry.get(job_id)
+    return job.report() if job else f"Error: No job '{job_id}'."
+
+def kill_job(job_id):
+    job = job_registry.get(job_id)
+    if job is None:
+        return f"Error: No job '{job_id}'."
+    job.kill()
+    job.wait(5)
+    return job.report()
+
+def split_file(content, max_tokens=None, overlap=0):
+    """Split text, or an iterable of lines, into token-bounded chunks."""
+    lines = content.splitlines(keepends=True) if isinstance(content, str) else content
+    return chunk_lines(lines, max_tokens or cfg.get_int('ingest_chunk_tokens'), overlap)
+
+def read_file(file):
     """Read file contents."""
     try:
-        with open(safe_join(WORKSPACE_FOLDER, filename), "r", encoding='utf-8') as f:
+        with open(safe_join(WORKSPACE_FOLDER, file), "r", encoding='utf-8') as f:
             return f.read()
     except Exception as e:
         return f"Error: {str(e)}"
 
-def ingest_file(filename, memory, max_length=4000, overlap=200):
-    """Ingest file into memory."""
+def ingest_file(filename, memory, max_tokens=None, overlap=None):
+    """Stream a workspace file into memory, replacing the memories of an earlier version of it."""
     try:
-        content = read_file(filename)
-        for i, chunk in enumerate(split_file(content, max_length, overlap)):
-            memory.add(f"File: {filename} | Part: {i + 1}\n{chunk}")
-        return f"Ingested {filename}."
+        report = ingest_files([(safe_join(WORKSPACE_FOLDER, filename), filename)], memory, None, max_tokens, overlap)
+        if report['errors']:
+            return f"Error ingesting '{filename}'."
+        return f"Ingested {filename}." if report['ingested'] else f"{filename} is already ingested and unchanged."
     except Exception as e:
         return f"Error ingesting '{filename}': {str(e)}"
 
-def write_to_file(filename, text):
+def write_to_file(file, text):
     """Write text to file."""
     try:
-        filepath = safe_join(WORKSPACE_FOLDER, filename)
+        filepath = safe_join(WORKSPACE_FOLDER, file)
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         with open(filepath, "w", encoding='utf-8') as f:
             f.write(text)
@@ -234,19 +281,19 @@ def write_to_file(filename, text):
     except Exception as e:
         return f"Error: {str(e)}"
 
-def append_to_file(filename, text):
+def append_to_file(file, text):
     """Append text to file."""
     try:
-        with open(safe_join(WORKSPACE_FOLDER, filename), "a", encoding='utf-8') as f:
+        with open(safe_join(WORKSPACE_FOLDER, file), "a", encoding='utf-8') as f:
             f.write(text)
         return "Text appended."
     except Exception as e:
         return f"Error: {str(e)}"
 
-def delete_file(filename):
+def delete_file(file):
     """Delete file."""
     try:
-        os.remove(safe_join(WORKSPACE_FOLDER, filename))
+        os.remove(safe_join(WORKSPACE_FOLDER, file))
         return "File deleted."
     except Exception as e:
         return f"Error: {str(e)}"
@@ -262,10 +309,18 @@ def search_files(directory):
     return found_files
 
 def summarize_multiple_urls(urls, question):
-    summaries = []
-    for url in urls:
-        summary = get_text_summary(url, question)
-        summaries.append(f"Summary of {url}:\n{summary}")
+    """Summarize pages as their concurrent fetches complete, returning them in input order."""
+    from scripts.management import fetch_many, summarize_text
+    summaries = [None] * len(urls)
+    for i, page, error in fetch_many(urls):
+        try:
+            if error:
+                raise RuntimeError(error)
+            summary = summarize_text(urls[i], page["text"], question)
+            summaries[i] = f"Summary of {urls[i]}:\nResult: {summary}"
+        except Exception as e:
+            logger.error(f"Summarizing '{urls[i]}' failed: {str(e)}")
+            summaries[i] = f"Summary of {urls[i]}:\nError: {str(e)}"
     return "\n\n".join(summaries)
 
 def compare_information(urls, question):
@@ -0,0 +1,149 @@
+# `.\scripts\pagecache.py` - On-disk caches of scraped pages and of the summaries made from them.
+
+# Imports
+import hashlib, json, os, sqlite3, threading, time
+from typing import Callable, Dict, List, Optional
+from scripts.utilities_two import logger
+
+# Classes
+class PageCache:
+    """Extracted text and links per (sanitized url, extractor kind), kept in a sqlite file.
+
+    Entries younger than `ttl` seconds are served without touching the network. Older ones are
+    revalidated with If-None-Match/If-Modified-Since, and served stale when the load fails or the
+    cache is `offline`. Least recently used pages are evicted once the stored text passes `max_bytes`.
+    """
+    def __init__(self, path: str, ttl: float = 3600, max_bytes: int = 256 * 2**20, offline: bool = False):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT, kind TEXT, text TEXT, links TEXT, etag TEXT, "
+                          "last_modified TEXT, fetched_at REAL, accessed_at REAL, size INTEGER, PRIMARY KEY (url, kind))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        self.stats = {'hits': 0, 'revalidated': 0, 'stale': 0, 'misses': 0}
+
+    def lookup(self, url: str, kind: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT text, links, etag, last_modified, fetched_at FROM pages WHERE url = ? AND kind = ?",
+                                    (url, kind)).fetchone()
+        if row is None:
+            return None
+        return {'text': row[0], 'links': json.loads(row[1]), 'etag': row[2], 'last_modified': row[3], 'fetched_at': row[4]}
+
+    def store(self, url: str, kind: str, page: Dict) -> Dict:
+        now = time.time()
+        page = {'etag': None, 'last_modified': None, **page, 'fetched_at': now}
+        size = len(page['text'].encode('utf-8'))
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM pages WHERE url = ? AND kind = ?", (url, kind)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                url, kind, page['text'], json.dumps(page['links']), page['etag'], page['last_modified'], now, now, size))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                for evicted_url, evicted_kind, evicted_size in self.conn.execute("SELECT url, kind, size FROM pages ORDER BY accessed_at").fetchall():
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    if (evicted_url, evicted_kind) != (url, kind):
+                        self.conn.execute("DELETE FROM pages WHERE url = ? AND kind = ?", (evicted_url, evicted_kind))
+                        self.total_bytes -= evicted_size
+            self.conn.commit()
+        return page
+
+    def _touch(self, url: str, kind: str, refreshed: bool = False):
+        now = time.time()
+        with self.lock:
+            if refreshed:
+                self.conn.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ? AND kind = ?", (now, now, url, kind))
+            else:
+                self.conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ? AND kind = ?", (now, url, kind))
+            self.conn.commit()
+
+    def get(self, url: str, load: Callable[[Dict[str, str]], Optional[Dict]], kind: str = "http") -> Dict:
+        """Return the cached page for url, calling load(conditional_headers) when it is missing or expired.
+
+        load returns a dict with 'text', 'links' and optionally 'etag'/'last_modified', or None when the
+        server answered 304 Not Modified. Errors from load propagate only when there is nothing cached.
+        """
+        entry = self.lookup(url, kind)
+        if entry is not None and (self.offline or time.time() - entry['fetched_at'] < self.ttl):
+            self._touch(url, kind)
+            self.stats['hits'] += 1
+            return entry
+        if self.offline:
+            raise LookupError(f"'{url}' is not in the page cache and browsing is offline")
+
+        headers = {}
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            page = load(headers)
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.debug(f"Page cache: serving stale '{url}' after failed load: {e}")
+            self._touch(url, kind)
+            self.stats['stale'] += 1
+            return entry
+
+        if page is None and entry is not None:
+            self._touch(url, kind, refreshed=True)
+            self.stats['revalidated'] += 1
+            return entry
+        self.stats['misses'] += 1
+        return self.store(url, kind, page)
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, 'bytes': self.total_bytes,
+                    'entries': self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]}
+
+class SummaryCache:
+    """Persistent LRU of chunk summaries keyed on (model path, question, hash of the chunk)."""
+    def __init__(self, path: str, max_entries: int = 20000):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT, last_used INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+        self.clock = self.conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM summaries").fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(model_path: str, question: str, chunk: str) -> str:
+        return hashlib.sha256(f"{model_path}\0{question}\0{chunk}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model_path: str, question: str, chunks: List[str]) -> List[Optional[str]]:
+        keys = [self.key(model_path, question, chunk) for chunk in chunks]
+        with self.lock:
+            found = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                found.update(self.conn.execute(f"SELECT key, summary FROM summaries WHERE key IN ({','.join('?' * len(batch))})", batch).fetchall())
+            self.clock += 1
+            self.conn.executemany("UPDATE summaries SET last_used = ? WHERE key = ?", [(self.clock, key) for key in found])
+            self.conn.commit()
+            hits = sum(key in found for key in keys)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(keys) - hits
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model_path: str, question: str, chunks: List[str], summaries: List[str]):
+        with self.lock:
+            self.clock += 1
+            self.conn.executemany("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", [
+                (self.key(model_path, question, chunk), summary, self.clock) for chunk, summary in zip(chunks, summaries)])
+            excess = self.conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute("DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY last_used LIMIT ?)", (excess,))
+            self.conn.commit()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
@@ -1,14 +1,23 @@
 # `.\scripts\prompt.py`
 
 # Imports
-import json, time
+import json, time, bisect, itertools
 from scripts.utilities_one import LocalCache, logger
-from scripts.config import Config
-from scripts.models import LlamaModel, JsonHandler
+from scripts.config import get_config
+from scripts.models import LlamaModel, JsonHandler, JsonStreamScanner, count_message_tokens, count_tokens_per_message, get_chat_token_counter
+from scripts.tracing import annotate, record_span, span
 
 # Globals
-cfg = Config()
-permanent_memory = LocalCache(cfg)
+cfg = get_config()
+MEMORY_TOKEN_BUDGET = 2500
+RESPONSE_TOKEN_RESERVE = 1000
+
+def __getattr__(name):
+    # The memory loads its whole store, so it is only built when first asked for
+    if name == 'permanent_memory':
+        globals()['permanent_memory'] = LocalCache(cfg)
+        return globals()['permanent_memory']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Classes
 class PromptGenerator:
@@ -25,12 +34,14 @@ class PromptGenerator:
                 "criticism": "constructive self-criticism",
                 "speak": "thoughts summary to say to user"
             },
-            "command": {
-                "name": "command name",
-                "args": {
-                    "arg name": "value"
+            "commands": [
+                {
+                    "name": "command name",
+                    "args": {
+                        "arg name": "value"
+                    }
                 }
-            }
+            ]
         }
 
     def add_constraint(self, constraint):
@@ -85,60 +96,105 @@ class PromptGenerator:
         )
         return prompt_string
 
+class HistoryTokenIndex:
+    """Per-message token counts and running totals for an append-only message history."""
+    def __init__(self, count_fn=None):
+        self.count_fn = count_fn or count_tokens_per_message
+        self.history = None
+        self.totals = [0]
+
+    def update(self, full_message_history):
+        if full_message_history is not self.history or len(full_message_history) < len(self.totals) - 1:
+            self.history, self.totals = full_message_history, [0]
+        for num_tokens in self.count_fn(full_message_history[len(self.totals) - 1:]):
+            self.totals.append(self.totals[-1] + num_tokens)
+
+    def newest_within(self, token_budget):
+        """Return (start index, tokens) of the longest history suffix fitting the budget."""
+        total = self.totals[-1]
+        start = bisect.bisect_left(self.totals, total - max(token_budget, 0))
+        return start, total - self.totals[start]
+
+history_token_index = HistoryTokenIndex()
+
 # Functions
 def create_chat_message(role, content):
     return {"role": role, "content": content}
 
-def generate_context(prompt, relevant_memory, full_message_history):
+def select_within_budget(token_counts, token_budget):
+    """Return how many leading items fit the budget, and their tokens."""
+    totals = list(itertools.accumulate(token_counts))
+    num_items = bisect.bisect_right(totals, token_budget)
+    return num_items, totals[num_items - 1] if num_items else 0
+
+def build_context(prompt, relevant_memory, full_message_history, user_input, token_limit):
+    send_token_limit = token_limit - RESPONSE_TOKEN_RESERVE
+    base_context = [
+        create_chat_message("system", prompt),
+        create_chat_message("system", f"The current time and date is {time.strftime('%c')}"),
+        create_chat_message("system", "This reminds you of these events from your past:\n"),
+    ]
+    user_message = create_chat_message("user", user_input)
+    base_tokens, user_tokens = count_message_tokens(base_context), count_message_tokens([user_message])
+
+    # Memory is ordered most relevant first, so keep the longest leading run that fits
+    memory_counts = [num_tokens + 1 for num_tokens in get_chat_token_counter().count_many(relevant_memory)]
+    num_memories, memory_tokens = select_within_budget(memory_counts, MEMORY_TOKEN_BUDGET - base_tokens)
+    base_context[-1] = create_chat_message("system", base_context[-1]["content"] + "\n".join(relevant_memory[:num_memories]) + "\n\n")
+
+    history_token_index.update(full_message_history)
+    history_start, history_tokens = history_token_index.newest_within(send_token_limit - base_tokens - memory_tokens - user_tokens)
+    current_context = base_context + full_message_history[history_start:] + [user_message]
+
+    budget = {
+        "system": base_tokens, "memory": memory_tokens, "history": history_tokens, "user": user_tokens,
+        "reply": token_limit - base_tokens - memory_tokens - history_tokens - user_tokens,
+        "memory_items": num_memories, "history_messages": len(full_message_history) - history_start,
+    }
+    logger.debug(f"Context budget: {budget}")
+    return current_context, budget
+
+def stream_reply(model, messages, max_tokens, on_token=None):
+    scanner, reply_parts = JsonStreamScanner(), []
+    started, first_token = time.perf_counter(), None
+    stream = model.stream_chat_completion(messages=messages, max_tokens=max_tokens)
     try:
-        current_context = [
-            create_chat_message("system", prompt),
-            create_chat_message("system", f"The current time and date is {time.strftime('%c')}"),
-            create_chat_message("system", f"This reminds you of these events from your past:\n{relevant_memory}\n\n")
-        ]
-        next_message_to_add_index = len(full_message_history) - 1
-        insertion_index = len(current_context)
-        current_tokens_used = LlamaModel.count_message_tokens(current_context)
-        return next_message_to_add_index, current_tokens_used, insertion_index, current_context
-    except Exception as e:
-        logger.error(f"Error generating context: {str(e)}")
-        return 0, 0, 0, []
-
-def chat_with_ai(prompt, user_input, full_message_history, permanent_memory, token_limit):
+        for token in stream:
+            first_token = first_token or time.perf_counter()
+            end = scanner.feed(token)
+            token = token[:end] if end >= 0 else token
+            reply_parts.append(token)
+            if on_token:
+                on_token(token)
+            if end >= 0:
+                logger.debug("Command JSON closed, stopping generation early.")
+                break
+    finally:
+        stream.close()
+        if first_token is not None:
+            # Time to the first token is prompt processing, the rest is generation
+            record_span("model.prefill", started, first_token)
+            record_span("model.decode", first_token, time.perf_counter(), chunks=len(reply_parts))
+    return "".join(reply_parts)
+
+def chat_with_ai(prompt, user_input, full_message_history, permanent_memory, token_limit, on_token=None):
     max_retries = 3
     retry_count = 0
     
     while retry_count < max_retries:
         try:
-            send_token_limit = token_limit - 1000
-            relevant_memory = '' if len(full_message_history) == 0 else permanent_memory.get_relevant(str(full_message_history[-9:]), 10)
-
-            next_message_to_add_index, current_tokens_used, insertion_index, current_context = generate_context(
-                prompt, relevant_memory, full_message_history)
-
-            while current_tokens_used > 2500:
-                relevant_memory = relevant_memory[1:]
-                next_message_to_add_index, current_tokens_used, insertion_index, current_context = generate_context(
-                    prompt, relevant_memory, full_message_history)
-
-            current_tokens_used += LlamaModel.count_message_tokens([create_chat_message("user", user_input)])
-
-            while next_message_to_add_index >= 0:
-                message_to_add = full_message_history[next_message_to_add_index]
-                tokens_to_add = LlamaModel.count_message_tokens([message_to_add])
-                if current_tokens_used + tokens_to_add > send_token_limit:
-                    break
-                current_context.insert(insertion_index, full_message_history[next_message_to_add_index])
-                current_tokens_used += tokens_to_add
-                next_message_to_add_index -= 1
-
-            current_context.append(create_chat_message("user", user_input))
-            tokens_remaining = token_limit - current_tokens_used
+            with span("memory.retrieve"):
+                relevant_memory = [] if len(full_message_history) == 0 else permanent_memory.get_relevant(str(full_message_history[-9:]), 10)
+            model = LlamaModel('chat')
+            with span("context.assemble"):
+                # A prompt longer than the model's context would be truncated or rejected
+                current_context, budget = build_context(prompt, relevant_memory, full_message_history, user_input,
+                                                        min(token_limit, model.slot_context_size()))
+                annotate(budget=budget)
+            tokens_remaining = budget["reply"]
 
-            assistant_reply = LlamaModel('chat').create_chat_completion(
-                messages=current_context,
-                max_tokens=tokens_remaining,
-            )
+            with span("model.generate", max_tokens=tokens_remaining):
+                assistant_reply = stream_reply(model, current_context, tokens_remaining, on_token)
 
             full_message_history.append(create_chat_message("user", user_input))
             full_message_history.append(create_chat_message("assistant", assistant_reply))
@@ -158,6 +214,7 @@ def get_prompt():
     prompt_generator.add_constraint("If you are unsure how you previously did something or want to recall past events, think about similar events.")
     prompt_generator.add_constraint("No user assistance, try to determine the best solutions, and act independently.")
     prompt_generator.add_constraint('Exclusively use the commands listed in double quotes e.g. "command name".')
+    prompt_generator.add_constraint("List several commands only when none needs another's result, they run at the same time and all results come back together.")
 
     commands = [
         ("Web Search", "web_search", {"query": "<search>"}),
@@ -176,6 +233,9 @@ def get_prompt():
         ("Write Tests", "write_tests", {"code": "<full_code_string>", "focus": "<list_of_focus_areas>"}),
         ("Execute Python File", "execute_python_file", {"file": "<file>"}),
         ("Execute Shell Command", "execute_shell", {"command_line": "<command_line>"}),
+        ("Start Background Shell Command", "start_job", {"command_line": "<command_line>"}),
+        ("Poll Background Command", "poll_job", {"job_id": "<job_id>"}),
+        ("Kill Background Command", "kill_job", {"job_id": "<job_id>"}),
         ("Task Complete (Shutdown)", "task_complete", {"reason": "<reason>"}),
         ("Do Nothing", "do_nothing", {}),
     ]
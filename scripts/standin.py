@@ -0,0 +1,120 @@
+# `.\scripts\standin.py` - A deterministic stand-in for llama-server, so the agent can be benchmarked without models, GPUs or network.
+
+# Imports
+import hashlib, itertools, json, struct, threading, time
+from typing import Iterator, List
+import numpy as np
+from scripts.tokenizer import GGUF_ARRAY, GGUF_MAGIC, GGUF_STRING, PRETOKENIZE, bytes_to_unicode, get_token_counter
+
+# Globals
+STAND_IN_WORDS = ("the agent reads files writes code runs tests and browses pages to plan next steps command name args "
+                  "thoughts text reasoning plan criticism speak file directory notes summary result step").split()
+
+# Classes
+class StandInServer:
+    """Serves completions and embeddings through the LlamaServer interface with fixed costs.
+
+    Prefill takes `prefill_ms_per_token` per prompt token, generation streams one token every
+    1 / `tokens_per_second` seconds from a fixed cycle of replies, and embeddings are unit vectors
+    seeded from a hash of the text. Identical runs therefore make identical calls and replies.
+    """
+    def __init__(self, model_type, model_path, replies: List[str], embed_dim: int,
+                 prefill_ms_per_token: float = 0.01, tokens_per_second: float = 500, embed_ms: float = 1.0):
+        self.model_type = model_type
+        self.model_path = model_path
+        self.replies = itertools.cycle(replies)
+        self.embed_dim = embed_dim
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.tokens_per_second = tokens_per_second
+        self.embed_ms = embed_ms
+        self.lock = threading.Lock()
+        self.stats = {'completions': 0, 'prompt_tokens': 0, 'generated_tokens': 0, 'embedded_texts': 0}
+
+    def is_running(self):
+        return True
+
+    def is_healthy(self):
+        return True
+
+    def stream_completion(self, prompt: str, max_tokens: int, temperature: float, prefix_key: str = None) -> Iterator[str]:
+        prompt_tokens = get_token_counter(self.model_path).count(prompt)
+        with self.lock:
+            reply = next(self.replies)
+            self.stats['completions'] += 1
+            self.stats['prompt_tokens'] += prompt_tokens
+        time.sleep(prompt_tokens * self.prefill_ms_per_token / 1000)
+        for token in PRETOKENIZE.findall(reply)[:max_tokens]:
+            time.sleep(1 / self.tokens_per_second)
+            with self.lock:
+                self.stats['generated_tokens'] += 1
+            yield token
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(len(texts) * self.embed_ms / 1000)
+        with self.lock:
+            self.stats['embedded_texts'] += len(texts)
+        embeddings = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+            vector = np.random.default_rng(seed).standard_normal(self.embed_dim).astype(np.float32)
+            embeddings.append((vector / np.linalg.norm(vector)).tolist())
+        return embeddings
+
+    def stop(self):
+        pass
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+# Functions
+def command_reply(name: str, args: dict, text: str = "Working through the plan one step at a time.") -> str:
+    return json.dumps({
+        "thoughts": {"text": text, "reasoning": "This is the next step of the plan.", "plan": "- read\n- write\n- review",
+                     "criticism": "Keep the steps small.", "speak": text},
+        "command": {"name": name, "args": args},
+    }, indent=2)
+
+def commands_reply(commands: List[tuple], text: str = "These steps do not depend on each other.") -> str:
+    return json.dumps({
+        "thoughts": {"text": text, "reasoning": "They can run together.", "plan": "- read\n- write\n- review",
+                     "criticism": "Keep the steps small.", "speak": text},
+        "commands": [{"name": name, "args": args} for name, args in commands],
+    }, indent=2)
+
+def scripted_replies() -> List[str]:
+    """A cycle of replies that exercises file commands, several commands in one reply, early stopping after the JSON and JSON repair."""
+    return [
+        command_reply("write_to_file", {"file": "notes.txt", "text": "The agent reads files and writes notes.\n" * 20}),
+        command_reply("read_file", {"file": "notes.txt"}),
+        command_reply("append_to_file", {"file": "notes.txt", "text": "Next steps: run tests.\n"}),
+        command_reply("search_files", {"directory": ""}) + "\nThe search results will tell me what to read next.",
+        commands_reply([("read_file", {"file": "notes.txt"}), ("search_files", {"directory": ""}), ("do_nothing", {})]),
+        '{thoughts: {text: "Nothing to do this step."}, command: {name: "do_nothing", args: {}}}',
+    ]
+
+def write_stand_in_gguf(path: str, words=STAND_IN_WORDS):
+    """Write a GGUF file holding only a byte-level BPE vocabulary, with merges that spell out `words`."""
+    byte_encoder = bytes_to_unicode()
+    tokens, merges = [byte_encoder[b] for b in range(256)], []
+    for word in words:
+        for spelled in (word, " " + word):
+            parts = [byte_encoder[b] for b in spelled.encode('utf-8')]
+            merged = parts[0]
+            for part in parts[1:]:
+                if f"{merged} {part}" not in merges:
+                    merges.append(f"{merged} {part}")
+                    tokens.append(merged + part)
+                merged += part
+
+    def string(value: str) -> bytes:
+        data = value.encode('utf-8')
+        return struct.pack("<Q", len(data)) + data
+
+    def string_array(key: str, values: List[str]) -> bytes:
+        return string(key) + struct.pack("<IIQ", GGUF_ARRAY, GGUF_STRING, len(values)) + b"".join(string(value) for value in values)
+
+    with open(path, "wb") as f:
+        f.write(GGUF_MAGIC + struct.pack("<IQQ", 3, 0, 2))
+        f.write(string_array("tokenizer.ggml.tokens", tokens))
+        f.write(string_array("tokenizer.ggml.merges", merges))
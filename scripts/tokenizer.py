@@ -0,0 +1,152 @@
+# `.\scripts\tokenizer.py` - Token counting with the vocabulary of the configured GGUF model.
+
+# Imports
+import hashlib, heapq, os, re, struct, threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import tiktoken
+from scripts.utilities_two import logger
+
+# Globals
+GGUF_MAGIC = b"GGUF"
+GGUF_SCALARS = {0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i", 6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d"}
+GGUF_STRING, GGUF_ARRAY = 8, 9
+TOKENIZER_KEYS = ("tokenizer.ggml.tokens", "tokenizer.ggml.merges")
+# Approximates the deepseek pre-tokenizer of llama.cpp with stdlib `re` classes, numbers cut into groups of up to 3 digits
+PRETOKENIZE = re.compile(r"[\r\n]|\s?[^\W\d_]+|\s?[!-/:-@\[-`{-~]+|\s+(?!\S)|\s+|\d{1,3}|\S")
+token_counters = {}
+token_counters_lock = threading.Lock()
+
+# Classes
+class GGUFReader:
+    def __init__(self, path):
+        self.path = path
+
+    def read_metadata(self, wanted_keys) -> Dict[str, object]:
+        """Read only the wanted metadata keys, stopping before the tensor data."""
+        found = {}
+        with open(self.path, "rb") as f:
+            if f.read(4) != GGUF_MAGIC:
+                raise ValueError(f"Not a GGUF file: {self.path}")
+            version, = struct.unpack("<I", f.read(4))
+            if version < 2:
+                raise ValueError(f"Unsupported GGUF version {version}: {self.path}")
+            _, kv_count = struct.unpack("<QQ", f.read(16))
+            for _ in range(kv_count):
+                key = self._read_string(f)
+                value_type, = struct.unpack("<I", f.read(4))
+                value = self._read_value(f, value_type)
+                if key in wanted_keys:
+                    found[key] = value
+                    if len(found) == len(wanted_keys):
+                        break
+        return found
+
+    def _read_string(self, f):
+        length, = struct.unpack("<Q", f.read(8))
+        return f.read(length).decode("utf-8", errors="replace")
+
+    def _read_value(self, f, value_type):
+        if value_type == GGUF_STRING:
+            return self._read_string(f)
+        if value_type == GGUF_ARRAY:
+            item_type, count = struct.unpack("<IQ", f.read(12))
+            return [self._read_value(f, item_type) for _ in range(count)]
+        fmt = GGUF_SCALARS[value_type]
+        return struct.unpack(fmt, f.read(struct.calcsize(fmt)))[0]
+
+class GGUFTokenizer:
+    def __init__(self, tokens: List[str], merges: List[str]):
+        self.vocab = {token: i for i, token in enumerate(tokens)}
+        self.ranks = {tuple(merge.split(" ", 1)): i for i, merge in enumerate(merges)}
+        self.byte_encoder = bytes_to_unicode()
+        self.word_cache = {}
+
+    @classmethod
+    def from_gguf(cls, model_path):
+        metadata = GGUFReader(model_path).read_metadata(TOKENIZER_KEYS)
+        if not all(key in metadata for key in TOKENIZER_KEYS):
+            raise ValueError(f"No BPE vocabulary in {model_path}")
+        return cls(*(metadata[key] for key in TOKENIZER_KEYS))
+
+    def _bpe(self, word):
+        """Merge the lowest ranked pair, leftmost first, until none is left; O(n log n) with a heap of candidate pairs."""
+        if word in self.word_cache:
+            return self.word_cache[word]
+        parts = [self.byte_encoder[b] for b in word.encode("utf-8")]
+        following = list(range(1, len(parts) + 1))  # Index of the next live part, len(parts) at the end
+        preceding = list(range(-1, len(parts) - 1))
+        heap = [(self.ranks[pair], i, *pair) for i, pair in enumerate(zip(parts, parts[1:])) if pair in self.ranks]
+        heapq.heapify(heap)
+        while heap:
+            _, i, left, right = heapq.heappop(heap)
+            j = following[i] if parts[i] is not None else len(parts)
+            if j == len(parts) or parts[i] != left or parts[j] != right:
+                continue  # Stale: one side was merged into something else since this pair was pushed
+            parts[i], parts[j] = left + right, None
+            following[i] = following[j]
+            if following[i] < len(parts):
+                preceding[following[i]] = i
+            for a, b in ((preceding[i], i), (i, following[i])):
+                if a >= 0 and b < len(parts) and (parts[a], parts[b]) in self.ranks:
+                    heapq.heappush(heap, (self.ranks[parts[a], parts[b]], a, parts[a], parts[b]))
+        parts = [part for part in parts if part is not None]
+        if len(self.word_cache) > 100000:
+            self.word_cache.clear()
+        self.word_cache[word] = parts
+        return parts
+
+    def encode(self, text: str) -> List[int]:
+        return [self.vocab.get(part, 0) for word in PRETOKENIZE.findall(text) for part in self._bpe(word)]
+
+class TokenCounter:
+    def __init__(self, model_path: Optional[str] = None, max_entries: int = 50000):
+        self.model_path = model_path
+        self.encoder = self._load_encoder(model_path)
+        self.counts = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _load_encoder(model_path):
+        if model_path and os.path.isfile(model_path):
+            try:
+                encoder = GGUFTokenizer.from_gguf(model_path)
+                logger.debug(f"Tokenizer: loaded {len(encoder.vocab)} tokens from {model_path}")
+                return encoder
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                logger.warn(f"Tokenizer: cannot read vocabulary from {model_path}, using cl100k_base: {e}")
+        return tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self.lock:
+            if key in self.counts:
+                self.counts.move_to_end(key)
+                return self.counts[key]
+        num_tokens = len(self.encoder.encode(text))
+        with self.lock:
+            self.counts[key] = num_tokens
+            if len(self.counts) > self.max_entries:
+                self.counts.popitem(last=False)
+        return num_tokens
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+# Functions
+def bytes_to_unicode():
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    codes, extra = printable[:], 0
+    for b in range(256):
+        if b not in printable:
+            printable.append(b)
+            codes.append(256 + extra)
+            extra += 1
+    return {b: chr(c) for b, c in zip(printable, codes)}
+
+def get_token_counter(model_path: Optional[str] = None) -> TokenCounter:
+    with token_counters_lock:
+        if model_path not in token_counters:
+            token_counters[model_path] = TokenCounter(model_path)
+        return token_counters[model_path]
@@ -0,0 +1,156 @@
+# `.\scripts\tracing.py` - Span tracing of the agent loop, written as JSONL under logs/traces; `python -m scripts.tracing` reports on it.
+
+# Imports
+import argparse, atexit, contextlib, contextvars, functools, glob, itertools, json, os, threading, time
+from typing import Dict, Iterable, List, Optional
+from scripts.config import get_config
+
+# Globals
+cfg = get_config()
+TRACE_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'logs', 'traces')
+current_span = contextvars.ContextVar('current_span', default=None)
+span_ids = itertools.count(1)
+
+# Classes
+class Span:
+    """One timed stage; spans opened inside it, on the same thread or context, become its children."""
+    def __init__(self, name: str, parent: Optional['Span'] = None, **attrs):
+        self.name = name
+        self.id = next(span_ids)
+        self.parent = parent
+        self.trace = parent.trace if parent else self.id
+        self.attrs = attrs
+        self.start = time.time()
+        self.started = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def record(self, duration: float, error: str = None) -> Dict:
+        record = {'trace': self.trace, 'span': self.id, 'parent': self.parent.id if self.parent else None, 'name': self.name,
+                  'start': round(self.start, 6), 'ms': round(duration * 1000, 3), 'thread': threading.current_thread().name, **self.attrs}
+        if error:
+            record['error'] = error
+        return record
+
+class TraceWriter:
+    """Appends span records to one JSONL file per run, opened on the first span."""
+    def __init__(self, folder: str = TRACE_FOLDER):
+        self.folder = folder
+        self.file = None
+        self.lock = threading.Lock()
+
+    def write(self, record: Dict, flush: bool = False):
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            if self.file is None:
+                os.makedirs(self.folder, exist_ok=True)
+                self.file = open(os.path.join(self.folder, f"trace_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.jsonl"), "a", encoding="utf-8")
+            self.file.write(line)
+            if flush:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+trace_writer = TraceWriter()
+atexit.register(trace_writer.close)
+
+# Functions
+def tracing_enabled() -> bool:
+    return cfg.get_bool('trace_enabled')
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """Time the enclosed block as a span; yields the Span (or None when tracing is off) for set()."""
+    if not tracing_enabled():
+        yield None
+        return
+    parent = current_span.get()
+    active = Span(name, parent, **attrs)
+    token = current_span.set(active)
+    error = None
+    try:
+        yield active
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span.reset(token)
+        trace_writer.write(active.record(time.perf_counter() - active.started, error), flush=parent is None)
+
+def traced(name: str = None):
+    """Decorator form of span(), named after the function unless a name is given."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name or function.__qualname__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_span(name: str, started: float, ended: float, **attrs):
+    """Record an interval measured with time.perf_counter() as a child of the current span."""
+    if not tracing_enabled():
+        return
+    active = Span(name, current_span.get(), **attrs)
+    active.start -= active.started - started
+    trace_writer.write(active.record(ended - started))
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span, if any."""
+    active = current_span.get()
+    if active is not None:
+        active.set(**attrs)
+
+def read_traces(paths: Iterable[str]) -> Iterable[Dict]:
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+
+def percentile(values: List[float], fraction: float) -> float:
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+def summarize(records: Iterable[Dict]) -> Dict[str, Dict[str, List[float]]]:
+    """Span durations grouped by stage name, and by command name for command spans."""
+    stages, commands = {}, {}
+    for record in records:
+        stages.setdefault(record['name'], []).append(record['ms'])
+        if 'command' in record:
+            commands.setdefault(str(record['command']), []).append(record['ms'])
+    return {'stage': stages, 'command': commands}
+
+def print_report(paths: List[str]):
+    groups = summarize(read_traces(paths))
+    for title, durations in groups.items():
+        print(f"{title:<28} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'total s':>9}")
+        for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            values.sort()
+            print(f"{name:<28} {len(values):>7} {percentile(values, 0.5):>10.1f} {percentile(values, 0.95):>10.1f} "
+                  f"{values[-1]:>10.1f} {sum(values) / 1000:>9.2f}")
+        print()
+
+def find_traces(all_runs: bool = False) -> List[str]:
+    """The trace file of the latest run, or of every run, in logs/traces."""
+    paths = sorted(glob.glob(os.path.join(TRACE_FOLDER, "trace_*.jsonl")), key=os.path.getmtime)
+    return paths if all_runs else paths[-1:]
+
+def main():
+    parser = argparse.ArgumentParser(description="Report p50/p95 latency per agent stage and command from trace files.")
+    parser.add_argument("paths", nargs="*", help="Trace files (default: the latest run in logs/traces)")
+    parser.add_argument("--all", action="store_true", help="Report on every run in logs/traces")
+    args = parser.parse_args()
+    paths = args.paths or find_traces(args.all)
+    if not paths:
+        parser.error(f"no trace files found in {os.path.normpath(TRACE_FOLDER)}")
+    print_report(paths)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,19 @@
 # `.\scripts\utilities.py`
 
 # Imports
-import yaml, win32com.client, logging, os, random, re, time
-from scripts.config import Config
+import yaml, os
+from scripts.config import get_config
 import dataclasses, orjson, numpy as np
 from typing import Any, List, Optional
 import threading
 from scripts.models import LlamaModel
+from scripts.utilities_two import logger, clean_input, input_with_timeout, say_text, remove_color_codes, read_python_exe_path
 
 # Globals
-cfg = Config()
-speaker = win32com.client.Dispatch("SAPI.SpVoice")
+cfg = get_config()
 SAVE_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SERIALIZE_DATACLASS
 get_embedding = lambda txt: Llama(model_path=cfg.smart_llm_model).embed(txt.replace("\n", " "))
 create_default_embeddings = lambda: np.zeros((0, cfg.embed_dim), np.float32)
-logger = Logger()
-PYTHON_EXE_PATH = read_python_exe_path()
 
 # Classes
 @dataclasses.dataclass
@@ -75,75 +73,6 @@ class LocalCache(MemoryProviderSingleton):
     def get_stats(self):
         with self.lock:
             return len(self.data.texts), self.data.embeddings.shape
-class Logger:
-    def __init__(self):
-        log_dir = os.path.join(os.path.dirname(__file__), '../logs')
-        os.makedirs(log_dir, exist_ok=True)
-
-        log_file = os.path.join(log_dir, "activity.log")
-        error_file = os.path.join(log_dir, "error.log")
-
-        console_formatter = AutoGptFormatter('%(title_color)s %(message)s')
-
-        self.typing_console_handler = TypingConsoleHandler()
-        self.console_handler = ConsoleHandler()
-        self.file_handler = logging.FileHandler(log_file)
-        error_handler = logging.FileHandler(error_file)
-
-        for handler in [self.typing_console_handler, self.console_handler]:
-            handler.setFormatter(console_formatter)
-
-        error_handler.setFormatter(AutoGptFormatter(
-            '%(asctime)s %(levelname)s %(module)s:%(lineno)d %(title)s %(message_no_color)s'
-        ))
-
-        self.typing_logger = self._create_logger('TYPER', [self.typing_console_handler, self.file_handler, error_handler])
-        self.logger = self._create_logger('LOGGER', [self.console_handler, self.file_handler, error_handler])
-
-        self._setup_log_rotation(log_file)
-
-    def _create_logger(self, name, handlers):
-        logger = logging.getLogger(name)
-        for handler in handlers:
-            logger.addHandler(handler)
-        logger.setLevel(logging.DEBUG)
-        return logger
-
-    def _setup_log_rotation(self, log_file, max_size=5*1024*1024, backup_count=5):
-        if os.path.getsize(log_file) > max_size:
-            for i in range(backup_count - 1, 0, -1):
-                older_log = f"{log_file}.{i}"
-                newer_log = f"{log_file}.{i + 1}"
-                if os.path.exists(older_log):
-                    os.rename(older_log, newer_log)
-            os.rename(log_file, f"{log_file}.1")
-            open(log_file, 'w').close()  # Clear the current log file
-
-    def typewriter_log(self, title='', title_color='', content='', speak_text=False, level=logging.INFO):
-        if speak_text and cfg.system_settings['speak_mode']:
-            say_text(f"{title}. {content}")
-        self.typing_logger.log(level, " ".join(content) if isinstance(content, list) else content, extra={'title': title, 'color': title_color})
-
-    def debug(self, message, title='', title_color=''):
-        self._log(title, title_color, message, logging.DEBUG)
-
-    def warn(self, message, title='', title_color=''):
-        self._log(title, title_color, message, logging.WARN)
-
-    def error(self, title, message=''):
-        self._log(title, '', message, logging.ERROR)
-
-    def _log(self, title='', title_color='', message='', level=logging.INFO):
-        self.logger.log(level, " ".join(message) if isinstance(message, list) else message, extra={'title': title, 'color': title_color})
-
-    def set_level(self, level):
-        self.logger.setLevel(level)
-        self.typing_logger.setLevel(level)
-
-    def double_check(self, additional_text=None):
-        additional_text = additional_text or "Check setup/config: https://github.com/Torantulino/Auto-GPT#readme"
-        self.typewriter_log("DOUBLE CHECK CONFIG", "", additional_text)
-
 def safe_join(base, *paths):
     """Safely join paths."""
     new_path = os.path.normpath(os.path.join(base, *paths))
@@ -152,26 +81,6 @@ def safe_join(base, *paths):
         raise ValueError("Path escape detected.")
     return new_path
 
-class TypingConsoleHandler(logging.StreamHandler):
-    def emit(self, record):
-        min_speed, max_speed = 0.05, 0.01
-        msg = self.format(record)
-        for word in msg.split():
-            print(word, end=" ", flush=True)
-            time.sleep(random.uniform(min_speed, max_speed))
-            min_speed, max_speed = min_speed * 0.95, max_speed * 0.95
-        print()
-
-class ConsoleHandler(logging.StreamHandler):
-    def emit(self, record):
-        print(self.format(record))
-
-class AutoGptFormatter(logging.Formatter):
-    def format(self, record):
-        record.title_color = f"{getattr(record, 'title', '')} "
-        record.message_no_color = remove_color_codes(getattr(record, 'msg', ''))
-        return super().format(record)
-
 # Functions
 def get_memory(cfg):
     memory_type = cfg.system_settings['memory_backend']
@@ -181,28 +90,6 @@ def get_memory(cfg):
         logger.warn(f"Unknown memory type '{memory_type}'. Using LocalCache.")
         return LocalCache(cfg)
 
-def remove_color_codes(s):
-    return re.sub(r'\x1B[@-_][0-?]*[ -/]*[@-~]', '', s)
-
-def clean_input(prompt='', timeout=None):
-    try:
-        if timeout:
-            return input_with_timeout(prompt, timeout)
-        return input(prompt)
-    except KeyboardInterrupt:
-        print("Interrupted. Exiting...")
-        exit(0)
-
-def input_with_timeout(prompt, timeout):
-    import sys, select
-    sys.stdout.write(prompt)
-    sys.stdout.flush()
-    ready, _, _ = select.select([sys.stdin], [], [], timeout)
-    if ready:
-        return sys.stdin.readline().strip()
-    else:
-        raise TimeoutError("Input timed out")
-
 def validate_yaml_file(file):
     try:
         with open(file) as f:
@@ -212,20 +99,3 @@ def validate_yaml_file(file):
         return False, f"File `{file}` not found"
     except yaml.YAMLError as e:
         return False, f"YAML error: {e}"
-
-def say_text(text, voice_index=0):
-    try:
-        speaker.Speak(text)
-        return True
-    except Exception as e:
-        logger.error(f"TTS error: {e}")
-        return False
-        
-def read_python_exe_path():
-    try:
-        with open(os.path.join("data", "persistence_batch.txt"), "r") as f:
-            for line in f:
-                if line.startswith("python_exe="):
-                    return line.split("=")[1].strip()
-    except FileNotFoundError:
-        return None        
\ No newline at end of file
@@ -1,75 +1,121 @@
 # `.\scripts\utilities_one.py` - The Main Utilities script.
 
 # Imports
+import atexit
 import yaml
-import win32com.client
-import logging
 import os
-import random
-import re
-import time
-from scripts.config import Config
+import functools
+from scripts.config import get_config
 import dataclasses
-import orjson
 import numpy as np
 from typing import Any, List, Optional
 import threading
 from scripts.models import LlamaModel
+from scripts.memory import AppendOnlyStore, EmbeddingBuffer, EmbeddingCache, create_index, migrate_json_cache, top_k
+from scripts.ingestion import clear_ingest_checkpoints
+from scripts.tracing import traced
+from scripts.utilities_two import logger, clean_input, input_with_timeout, say_text, remove_color_codes, read_python_exe_path
 
 # Globals
-cfg = Config()
-speaker = win32com.client.Dispatch("SAPI.SpVoice")
-SAVE_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SERIALIZE_DATACLASS
-get_embedding = lambda txt: LlamaModel('chat').embed(txt.replace("\n", " "))
-create_default_embeddings = lambda: np.zeros((0, cfg.llm_model_settings['embed_dim']), np.float32)
-logger = Logger()
-PYTHON_EXE_PATH = read_python_exe_path()
+cfg = get_config()
+embedding_cache = None  # Opened on first use, see get_embedding_cache()
+embedding_cache_lock = threading.Lock()
+get_embedding = lambda txt: get_embeddings([txt])[0]
+create_default_embeddings = lambda: EmbeddingBuffer(cfg.llm_model_settings['embed_dim'], quantization=cfg.system_settings['memory_quantization'])
 
 # Classes
 @dataclasses.dataclass
 class CacheContent:
     texts: List[str] = dataclasses.field(default_factory=list)
-    embeddings: np.ndarray = dataclasses.field(default_factory=create_default_embeddings)
+    embeddings: EmbeddingBuffer = dataclasses.field(default_factory=create_default_embeddings)
 
 class MemoryProviderSingleton:
     def add(self, data: str) -> str: pass
+    def add_many(self, data: List[str]) -> List[Optional[int]]: pass
+    def delete_many(self, ids: List[int]) -> None: pass
     def get(self, data: str) -> Optional[List[Any]]: pass
     def clear(self) -> str: pass
     def get_relevant(self, data: str, num_relevant: int = 5) -> List[Any]: pass
     def get_stats(self) -> Any: pass
 
 class LocalCache(MemoryProviderSingleton):
-    def __init__(self, cfg):
-        self.filename = f"{cfg.system_settings['memory_index']}.json"
+    """Memory kept in the store at `memory_index`, with its texts, embeddings and search index in RAM.
+
+    There is one instance per store path: every LocalCache(cfg) in the process for the same path
+    returns it, so appends are serialized by one lock and ids line up with one in-memory view.
+    """
+    instances = {}
+    instances_lock = threading.Lock()
+
+    def __new__(cls, cfg):
+        path = os.path.abspath(cfg.system_settings['memory_index'])
+        with cls.instances_lock:
+            if path not in cls.instances:
+                instance = super().__new__(cls)
+                instance._load(cfg)
+                cls.instances[path] = instance
+            return cls.instances[path]
+
+    def _load(self, cfg):
+        self.filename = cfg.system_settings['memory_index']
         self.lock = threading.Lock()
-        if os.path.exists(self.filename):
-            try:
-                with open(self.filename, 'r+b') as f:
-                    content = f.read() or b'{}'
-                    self.data = CacheContent(**orjson.loads(content))
-            except orjson.JSONDecodeError:
-                logger.error(f"Error: {self.filename} not JSON.")
-                self.data = CacheContent()
-        else:
-            logger.warn(f"Warning: {self.filename} missing.")
-            self.data = CacheContent()
+        self.store = AppendOnlyStore(self.filename, cfg.llm_model_settings['embed_dim'])
+        migrate_json_cache(f"{self.filename}.json", self.store)
+        if not self.store.count:
+            logger.warn(f"Warning: {self.filename} memory is empty.")
+        quantization = cfg.system_settings['memory_quantization']
+        self.data = CacheContent(texts=self.store.read_texts(), embeddings=EmbeddingBuffer(self.store.dim, self.store.read_embeddings(), quantization=quantization))
+        self.rerank = cfg.system_settings['memory_rerank'] if quantization != 'none' else 0
+        self.index = create_index(cfg.system_settings['memory_backend'], self.data.embeddings, cfg.system_settings)
+        self.index.add(list(range(len(self.data.texts))), self.store.read_embeddings())
+        self.tombstones = set(self.store.read_tombstones().tolist())
 
     def add(self, text: str) -> str:
-        if 'Command Error:' not in text:
-            with self.lock:
-                self.data.texts.append(text)
-                vec = np.array(get_embedding(text), np.float32)[np.newaxis, :]
-                if vec.shape[1] != cfg.llm_model_settings['embed_dim']:
-                    logger.error(f"Embedding dimension mismatch: Expected {cfg.llm_model_settings['embed_dim']}, got {vec.shape[1]}")
-                self.data.embeddings = np.concatenate([self.data.embeddings, vec], axis=0)
-                with open(self.filename, 'wb') as f:
-                    f.write(orjson.dumps(self.data, option=SAVE_OPTIONS))
+        self.add_many([text])
         logger.debug(f"Memory updated with text: {text}")
         return text
 
+    def add_many(self, texts: List[str]) -> List[Optional[int]]:
+        """Embed texts in batches, then store them with one write; returns their memory ids.
+
+        Ids line up with texts, with None for texts that were skipped or not stored.
+        """
+        kept = [i for i, text in enumerate(texts) if 'Command Error:' not in text]
+        result = [None] * len(texts)
+        if not kept:
+            return result
+        texts = [texts[i] for i in kept]
+        vecs = np.array(get_embeddings(texts), np.float32).reshape(len(texts), -1)
+        if vecs.shape[1] != cfg.llm_model_settings['embed_dim']:
+            logger.error(f"Embedding dimension mismatch: Expected {cfg.llm_model_settings['embed_dim']}, got {vecs.shape[1]}")
+            return result
+        with self.lock:
+            ids = self.store.append(texts, vecs)
+            self.data.texts.extend(texts)
+            self.data.embeddings.append(vecs)
+            self.index.add(ids, vecs)
+        for i, memory_id in zip(kept, ids):
+            result[i] = memory_id
+        logger.debug(f"Memory updated with {len(texts)} texts")
+        return result
+
+    def delete_many(self, ids: List[int]):
+        """Tombstone memories; they stay on disk and in the index but are no longer retrieved."""
+        with self.lock:
+            ids = [i for i in dict.fromkeys(ids) if i is not None and i not in self.tombstones]
+            if ids:
+                self.store.delete(ids)
+                self.tombstones.update(ids)
+        logger.debug(f"Memory tombstoned {len(ids)} texts")
+
     def clear(self):
         with self.lock:
-            self.data = CacheContent()
+            self.data.texts.clear()
+            self.data.embeddings.clear()
+            self.index.clear()
+            self.store.clear()
+            self.tombstones.clear()
+            clear_ingest_checkpoints()  # The manifest's ids point into the cleared store, so every file is ingested afresh
             logger.debug("Memory cleared")
 
     def get(self, data: str) -> Optional[List[Any]]:
@@ -77,83 +123,30 @@ class LocalCache(MemoryProviderSingleton):
 
     def get_relevant(self, txt: str, k: int = 5) -> List[Any]:
         with self.lock:
-            scores = np.dot(self.data.embeddings, get_embedding(txt))
+            query = np.array(get_embedding(txt), np.float32)
+            ids = self._search_live(query, k)
             logger.debug(f"Retrieved relevant memory for: {txt}")
-            return [self.data.texts[i] for i in np.argsort(scores)[-k:][::-1]]
+            return [self.data.texts[i] for i in ids]
+
+    def _search(self, query: np.ndarray, k: int) -> np.ndarray:
+        if self.rerank:
+            ids = self.index.search(query, k * self.rerank)
+            return ids[top_k(self.store.read_rows(ids) @ query, k)]
+        return self.index.search(query, k)
+
+    def _search_live(self, query: np.ndarray, k: int) -> List[int]:
+        """Over-fetch past tombstoned memories, doubling the search until k live ones are found."""
+        fetch = k + min(len(self.tombstones), k)
+        while True:
+            ids = [i for i in self._search(query, fetch).tolist() if i not in self.tombstones]
+            if len(ids) >= k or fetch >= len(self.data.texts):
+                return ids[:k]
+            fetch *= 2
 
     def get_stats(self):
         with self.lock:
             return len(self.data.texts), self.data.embeddings.shape
 
-class Logger:
-    def __init__(self):
-        log_dir = os.path.join(os.path.dirname(__file__), '../logs')
-        os.makedirs(log_dir, exist_ok=True)
-
-        log_file = os.path.join(log_dir, "activity.log")
-        error_file = os.path.join(log_dir, "error.log")
-
-        console_formatter = AutoGptFormatter('%(title_color)s %(message)s')
-
-        self.typing_console_handler = TypingConsoleHandler()
-        self.console_handler = ConsoleHandler()
-        self.file_handler = logging.FileHandler(log_file)
-        error_handler = logging.FileHandler(error_file)
-
-        for handler in [self.typing_console_handler, self.console_handler]:
-            handler.setFormatter(console_formatter)
-
-        error_handler.setFormatter(AutoGptFormatter(
-            '%(asctime)s %(levelname)s %(module)s:%(lineno)d %(title)s %(message_no_color)s'
-        ))
-
-        self.typing_logger = self._create_logger('TYPER', [self.typing_console_handler, self.file_handler, error_handler])
-        self.logger = self._create_logger('LOGGER', [self.console_handler, self.file_handler, error_handler])
-
-        self._setup_log_rotation(log_file)
-
-    def _create_logger(self, name, handlers):
-        logger = logging.getLogger(name)
-        for handler in handlers:
-            logger.addHandler(handler)
-        logger.setLevel(logging.DEBUG)
-        return logger
-
-    def _setup_log_rotation(self, log_file, max_size=5*1024*1024, backup_count=5):
-        if os.path.getsize(log_file) > max_size:
-            for i in range(backup_count - 1, 0, -1):
-                older_log = f"{log_file}.{i}"
-                newer_log = f"{log_file}.{i + 1}"
-                if os.path.exists(older_log):
-                    os.rename(older_log, newer_log)
-            os.rename(log_file, f"{log_file}.1")
-            open(log_file, 'w').close()  # Clear the current log file
-
-    def typewriter_log(self, title='', title_color='', content='', speak_text=False, level=logging.INFO):
-        if speak_text and cfg.system_settings['speak_mode']:
-            say_text(f"{title}. {content}")
-        self.typing_logger.log(level, " ".join(content) if isinstance(content, list) else content, extra={'title': title, 'color': title_color})
-
-    def debug(self, message, title='', title_color=''):
-        self._log(title, title_color, message, logging.DEBUG)
-
-    def warn(self, message, title='', title_color=''):
-        self._log(title, title_color, message, logging.WARN)
-
-    def error(self, title, message=''):
-        self._log(title, '', message, logging.ERROR)
-
-    def _log(self, title='', title_color='', message='', level=logging.INFO):
-        self.logger.log(level, " ".join(message) if isinstance(message, list) else message, extra={'title': title, 'color': title_color})
-
-    def set_level(self, level):
-        self.logger.setLevel(level)
-        self.typing_logger.setLevel(level)
-
-    def double_check(self, additional_text=None):
-        additional_text = additional_text or "Check setup/config: https://github.com/Torantulino/Auto-GPT#readme"
-        self.typewriter_log("DOUBLE CHECK CONFIG", "", additional_text)
-
 def safe_join(base, *paths):
     """Safely join paths."""
     new_path = os.path.normpath(os.path.join(base, *paths))
@@ -162,58 +155,46 @@ def safe_join(base, *paths):
         raise ValueError("Path escape detected.")
     return new_path
 
-class TypingConsoleHandler(logging.StreamHandler):
-    def emit(self, record):
-        min_speed, max_speed = 0.05, 0.01
-        msg = self.format(record)
-        for word in msg.split():
-            print(word, end=" ", flush=True)
-            time.sleep(random.uniform(min_speed, max_speed))
-            min_speed, max_speed = min_speed * 0.95, max_speed * 0.95
-        print()
-
-class ConsoleHandler(logging.StreamHandler):
-    def emit(self, record):
-        print(self.format(record))
-
-class AutoGptFormatter(logging.Formatter):
-    def format(self, record):
-        record.title_color = f"{getattr(record, 'title', '')} "
-        record.message_no_color = remove_color_codes(getattr(record, 'msg', ''))
-        return super().format(record)
-
 # Functions
+def get_embedding_cache():
+    """The persistent embedding cache, opened on first use rather than when the module is imported."""
+    global embedding_cache
+    with embedding_cache_lock:
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(os.path.join("cache", "embeddings.sqlite3"), cfg.system_settings['embedding_cache_size'])
+            atexit.register(embedding_cache.close)  # Writes the recency of hits not yet flushed
+        return embedding_cache
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_model():
+    """The chat model, which also embeds, found in the model folder once instead of on every call."""
+    return LlamaModel('chat')
+
+cfg.subscribe('model_path', lambda key, value: get_embedding_model.cache_clear())
+
+@traced("memory.embed")
+def get_embeddings(txts):
+    """Embed texts, only sending the ones missing from the embedding cache to the model."""
+    model, cache = get_embedding_model(), get_embedding_cache()
+    txts = [txt.replace("\n", " ") for txt in txts]
+    vectors = cache.get_many(model.model_path, txts)
+    missing = list(dict.fromkeys(txt for txt, vector in zip(txts, vectors) if vector is None))
+    if missing:
+        embedded = dict(zip(missing, model.embed_many(missing)))
+        cache.put_many(model.model_path, missing, [embedded[txt] for txt in missing])
+        vectors = [embedded[txt] if vector is None else vector for txt, vector in zip(txts, vectors)]
+    if logger.debug_enabled():
+        logger.debug(f"Embedding cache: {cache.get_stats()}")  # Counts every cached row, so only when it is shown
+    return vectors
+
 def get_memory(cfg):
     memory_type = cfg.system_settings['memory_backend']
-    if memory_type == "local":
+    if memory_type.startswith("local"):
         return LocalCache(cfg)
     else:
         logger.warn(f"Unknown memory type '{memory_type}'. Using LocalCache.")
         return LocalCache(cfg)
 
-def remove_color_codes(s):
-    return re.sub(r'\x1B[@-_][0-?]*[ -/]*[@-~]', '', s)
-
-def clean_input(prompt='', timeout=None):
-    try:
-        if timeout:
-            return input_with_timeout(prompt, timeout)
-        return input(prompt)
-    except KeyboardInterrupt:
-        print("Interrupted. Exiting...")
-        exit(0)
-
-def input_with_timeout(prompt, timeout):
-    import sys
-    import select
-    sys.stdout.write(prompt)
-    sys.stdout.flush()
-    ready, _, _ = select.select([sys.stdin], [], [], timeout)
-    if ready:
-        return sys.stdin.readline().strip()
-    else:
-        raise TimeoutError("Input timed out")
-
 def validate_yaml_file(file):
     try:
         with open(file) as f:
@@ -223,20 +204,3 @@ def validate_yaml_file(file):
         return False, f"File `{file}` not found"
     except yaml.YAMLError as e:
         return False, f"YAML error: {e}"
-
-def say_text(text, voice_index=0):
-    try:
-        speaker.Speak(text)
-        return True
-    except Exception as e:
-        logger.error(f"TTS error: {e}")
-        return False
-
-def read_python_exe_path():
-    try:
-        with open(os.path.join("data", "persistence_batch.txt"), "r") as f:
-            for line in f:
-                if line.startswith("python_exe="):
-                    return line.split("=")[1].strip()
-    except FileNotFoundError:
-        return None
\ No newline at end of file
@@ -1,17 +1,23 @@
 # `.\scripts\utilities_two.py` The Utilities script to fix circular imports.
 
 # Imports
+import atexit
+import functools
 import logging
+import logging.handlers
 import os
+import queue
 import random
 import re
+import threading
 import time
-import win32com.client
-from scripts.config import Config
+from scripts.config import get_config
 
 # Global Config
-cfg = Config()
-speaker = win32com.client.Dispatch("SAPI.SpVoice")
+cfg = get_config()
+speaker = None
+speaker_lock = threading.Lock()
+speech_queue = None
 
 class AutoGptFormatter(logging.Formatter):
     def format(self, record):
@@ -23,6 +29,9 @@ class TypingConsoleHandler(logging.StreamHandler):
     def emit(self, record):
         min_speed, max_speed = 0.05, 0.01
         msg = self.format(record)
+        if cfg.get_bool('fast_console'):
+            print(msg, flush=True)
+            return
         for word in msg.split():
             print(word, end=" ", flush=True)
             time.sleep(random.uniform(min_speed, max_speed))
@@ -33,18 +42,39 @@ class ConsoleHandler(logging.StreamHandler):
     def emit(self, record):
         print(self.format(record))
 
+class StreamConsoleHandler(logging.StreamHandler):
+    def emit(self, record):
+        print(record.getMessage(), end="", flush=True)
+
 class Logger:
-    def __init__(self):
-        log_dir = os.path.join(os.path.dirname(__file__), '../logs')
-        os.makedirs(log_dir, exist_ok=True)
+    """The console and file loggers, whose handlers and log files are only created once something is logged.
+
+    When queued, the logging thread only puts records on a queue; a QueueListener thread does the
+    typing animation and the file writes, so a slow console never holds up the agent loop.
+    """
+    def __init__(self, log_dir=None, queued=True):
+        self.log_dir = log_dir or os.path.join(os.path.dirname(__file__), '../logs')
+        self.queued = queued
 
-        log_file = os.path.join(log_dir, "activity.log")
-        error_file = os.path.join(log_dir, "error.log")
+    def __getattr__(self, name):
+        if name.startswith('_') or self.__dict__.get('_ready'):
+            raise AttributeError(name)
+        self._ready = True
+        self._setup()
+        return getattr(self, name)
+
+    def _setup(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        log_file = os.path.join(self.log_dir, "activity.log")
+        error_file = os.path.join(self.log_dir, "error.log")
+        self._setup_log_rotation(log_file)  # Before the file is opened, as Windows cannot rename an open file
 
         console_formatter = AutoGptFormatter('%(title_color)s %(message)s')
 
         self.typing_console_handler = TypingConsoleHandler()
         self.console_handler = ConsoleHandler()
+        self.stream_console_handler = StreamConsoleHandler()
         self.file_handler = logging.FileHandler(log_file)
         error_handler = logging.FileHandler(error_file)
 
@@ -55,10 +85,24 @@ class Logger:
             '%(asctime)s %(levelname)s %(module)s:%(lineno)d %(title)s %(message_no_color)s'
         ))
 
-        self.typing_logger = self._create_logger('TYPER', [self.typing_console_handler, self.file_handler, error_handler])
-        self.logger = self._create_logger('LOGGER', [self.console_handler, self.file_handler, error_handler])
-
-        self._setup_log_rotation(log_file)
+        self.typing_console_handler.addFilter(lambda record: record.name == 'TYPER')
+        self.console_handler.addFilter(lambda record: record.name == 'LOGGER')
+        self.stream_console_handler.addFilter(lambda record: record.name == 'STREAM')
+        for handler in [self.file_handler, error_handler]:
+            handler.addFilter(lambda record: record.name != 'STREAM')
+        self.handlers = [self.typing_console_handler, self.console_handler, self.stream_console_handler, self.file_handler, error_handler]
+        if self.queued:
+            self.queue = queue.Queue()
+            self.listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+            self.listener.start()
+            self.front_handlers = [logging.handlers.QueueHandler(self.queue)]
+        else:
+            self.front_handlers = self.handlers
+
+        self.typing_logger = self._create_logger('TYPER', self.front_handlers)
+        self.logger = self._create_logger('LOGGER', self.front_handlers)
+        self.stream_logger = self._create_logger('STREAM', self.front_handlers)
+        atexit.register(self.close)
 
     def _create_logger(self, name, handlers):
         logger = logging.getLogger(name)
@@ -68,7 +112,7 @@ class Logger:
         return logger
 
     def _setup_log_rotation(self, log_file, max_size=5*1024*1024, backup_count=5):
-        if os.path.getsize(log_file) > max_size:
+        if os.path.exists(log_file) and os.path.getsize(log_file) > max_size:
             for i in range(backup_count - 1, 0, -1):
                 older_log = f"{log_file}.{i}"
                 newer_log = f"{log_file}.{i + 1}"
@@ -79,9 +123,13 @@ class Logger:
 
     def typewriter_log(self, title='', title_color='', content='', speak_text=False, level=logging.INFO):
         if speak_text and cfg.system_settings['speak_mode']:
-            say_text(f"{title}. {content}")
+            speak(f"{title}. {content}")
         self.typing_logger.log(level, " ".join(content) if isinstance(content, list) else content, extra={'title': title, 'color': title_color})
 
+    def stream(self, text):
+        """Print streamed model output as it arrives, after the log lines queued before it rather than in between their words."""
+        self.stream_logger.info(text)
+
     def debug(self, message, title='', title_color=''):
         self._log(title, title_color, message, logging.DEBUG)
 
@@ -98,21 +146,92 @@ class Logger:
         self.logger.setLevel(level)
         self.typing_logger.setLevel(level)
 
+    def debug_enabled(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
     def double_check(self, additional_text=None):
         additional_text = additional_text or "Check setup/config: https://github.com/Torantulino/Auto-GPT#readme"
         self.typewriter_log("DOUBLE CHECK CONFIG", "", additional_text)
 
+    def flush(self):
+        """Wait until every queued record has been printed and written."""
+        if self.__dict__.get('listener'):
+            self.queue.join()
+
+    def close(self):
+        """Drain the queue, then detach and close the handlers."""
+        if not self.__dict__.get('_ready'):
+            return
+        listener = self.__dict__.pop('listener', None)
+        if listener:
+            listener.stop()
+        for handler in self.__dict__.pop('front_handlers', []):
+            self.typing_logger.removeHandler(handler)
+            self.logger.removeHandler(handler)
+            self.stream_logger.removeHandler(handler)
+        for handler in self.__dict__.pop('handlers', []):
+            handler.close()
+
 def remove_color_codes(s):
     return re.sub(r'\x1B[@-_][0-?]*[ -/]*[@-~]', '', s)
 
+def get_speaker():
+    """The SAPI voice, dispatched on first use rather than when the module is imported."""
+    global speaker
+    with speaker_lock:
+        if speaker is None:
+            import win32com.client
+            speaker = win32com.client.Dispatch("SAPI.SpVoice")
+        return speaker
+
+def speak(text):
+    """Queue text for the speech worker thread, so speaking never blocks the caller."""
+    global speech_queue
+    with speaker_lock:
+        if speech_queue is None:
+            speech_queue = queue.Queue()
+            threading.Thread(target=speech_worker, name="speech", daemon=True).start()
+    speech_queue.put(text)
+
+def speech_worker():
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()  # SAPI is apartment threaded, so the voice is created and used on this thread
+    except ImportError:
+        pass
+    while True:
+        say_text(speech_queue.get())
+
 def say_text(text, voice_index=0):
     try:
-        speaker.Speak(text)
+        get_speaker().Speak(text)
         return True
     except Exception as e:
         logger.error(f"TTS error: {e}")
         return False
 
+def clean_input(prompt='', timeout=None):
+    logger.flush()  # Let queued log lines finish printing before the prompt
+    try:
+        if timeout:
+            return input_with_timeout(prompt, timeout)
+        return input(prompt)
+    except KeyboardInterrupt:
+        print("Interrupted. Exiting...")
+        exit(0)
+
+def input_with_timeout(prompt, timeout):
+    import sys
+    import select
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    ready, _, _ = select.select([sys.stdin], [], [], timeout)
+    if ready:
+        return sys.stdin.readline().strip()
+    else:
+        raise TimeoutError("Input timed out")
+
+@functools.lru_cache(maxsize=None)
 def read_python_exe_path():
     try:
         with open(os.path.join("data", "persistence_batch.txt"), "r") as f:
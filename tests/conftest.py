@@ -0,0 +1,22 @@
+# `.\tests\conftest.py` - Shared fixtures: a stand-in GGUF vocabulary so token counts need no real model.
+
+# Imports
+import os
+import pytest
+from scripts import models
+from scripts.config import get_config
+from scripts.standin import write_stand_in_gguf
+
+@pytest.fixture
+def stand_in_model(tmp_path):
+    """Point model_path at a folder holding only the stand-in vocabulary, and return its file."""
+    cfg = get_config()
+    model_file = os.path.join(tmp_path, "models", "DeepSeek-V2-Lite-Chat-Q4_K_M-stand-in.gguf")
+    os.makedirs(os.path.dirname(model_file))
+    write_stand_in_gguf(model_file)
+    saved = cfg.get('model_path')
+    cfg.set('model_path', os.path.dirname(model_file))
+    models.get_chat_token_counter.cache_clear()
+    yield model_file
+    cfg.set('model_path', saved)
+    models.get_chat_token_counter.cache_clear()
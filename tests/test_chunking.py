@@ -0,0 +1,86 @@
+# `.\tests\test_chunking.py` - Block grouping and token-bounded chunking round trips.
+
+# Imports
+import random
+from scripts.chunking import chunk_lines, chunk_text, iter_blocks
+
+def count_words(text):
+    return len(text.split())
+
+def count_chars(text):
+    return len(text)
+
+def random_document(rng, paragraphs=60):
+    words = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+    parts = []
+    for _ in range(paragraphs):
+        kind = rng.random()
+        if kind < 0.15:
+            parts.append("```python\n" + "".join(f"x{i} = {i}\n" for i in range(rng.randint(1, 12))) + "```\n")
+        elif kind < 0.25:
+            parts.append("".join(rng.choice("abcdef0123456789") for _ in range(rng.randint(50, 400))) + "\n")  # One long "word"
+        else:
+            sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 15))) + rng.choice(".!?") for _ in range(rng.randint(1, 6))]
+            parts.append(" ".join(sentences) + "\n")
+        parts.append("\n" * rng.randint(1, 2))
+    return "".join(parts)
+
+def test_blocks_are_lossless():
+    rng = random.Random(1)
+    text = random_document(rng)
+    lines = text.splitlines(keepends=True)
+    assert "".join(iter_blocks(lines)) == text
+    assert "".join(iter_blocks(lines, max_chars=64)) == text
+
+def test_blocks_keep_code_fences_whole():
+    text = "intro\n\n```\na\n\nb\n```\nafter\n"
+    assert list(iter_blocks(text.splitlines(keepends=True))) == ["intro\n\n", "```\na\n\nb\n```\n", "after\n"]
+
+def test_blocks_cut_text_without_blank_lines():
+    lines = [f"log line {i}\n" for i in range(1000)]
+    blocks = list(iter_blocks(lines, max_chars=200))
+    assert len(blocks) > 1
+    assert max(len(block) for block in blocks) < 200 + len(lines[-1])
+
+def test_chunks_without_overlap_rebuild_the_text():
+    rng = random.Random(2)
+    for max_tokens in (5, 17, 64, 500):
+        text = random_document(rng)
+        chunks = list(chunk_text(text, max_tokens, count_fn=count_chars))
+        assert "".join(chunks) == text
+        assert all(count_chars(chunk) <= max_tokens for chunk in chunks)
+
+def test_chunks_stay_within_budget_with_overlap():
+    rng = random.Random(3)
+    text = random_document(rng)
+    for max_tokens, overlap in ((8, 3), (40, 10), (200, 50)):
+        assert all(count_chars(chunk) <= max_tokens for chunk in chunk_text(text, max_tokens, overlap, count_fn=count_chars))
+
+def test_overlap_repeats_the_tail_of_the_previous_chunk():
+    words = [f"w{i}" for i in range(500)]  # Unique words, so the repeated part is unambiguous
+    chunks = [chunk.split() for chunk in chunk_text(" ".join(words) + "\n", 20, 5, count_fn=count_words)]
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk[:5] == previous[-5:]
+    assert [word for chunk in chunks for word in (chunk if chunk is chunks[0] else chunk[5:])] == words
+
+def test_multi_token_characters_stay_within_budget():
+    def count_costly(text):
+        return sum(3 if ord(c) > 127 else 1 for c in text)
+    rng = random.Random(4)
+    text = "".join(rng.choice("ab€😀") for _ in range(3000))
+    for max_tokens, overlap in ((3, 1), (7, 2), (50, 10)):
+        chunks = list(chunk_text(text, max_tokens, overlap, count_fn=count_costly))
+        assert max(count_costly(chunk) for chunk in chunks) <= max_tokens
+    assert "".join(chunk_text(text, 7, count_fn=count_costly)) == text
+
+def test_chunk_lines_is_lazy():
+    read = []
+
+    def lines():
+        for i in range(100000):
+            read.append(i)
+            yield f"line {i} of a file without blank lines\n"
+    first = next(chunk_lines(lines(), 50, count_fn=count_words))
+    assert count_words(first) <= 50
+    assert len(read) < 1000
@@ -0,0 +1,71 @@
+# `.\tests\test_memory_store.py` - AppendOnlyStore round trips, crash recovery and tombstones.
+
+# Imports
+import numpy as np
+from scripts.memory import INDEX_ENTRY_SIZE, AppendOnlyStore
+
+DIM = 4
+
+def rows(count, start=0):
+    return np.arange(start * DIM, (start + count) * DIM, dtype=np.float32).reshape(count, DIM)
+
+def test_append_survives_reopen(tmp_path):
+    store = AppendOnlyStore(str(tmp_path / "memory"), DIM)
+    assert store.append(["one", "twö"], rows(2)) == [0, 1]
+    assert store.append(["three"], rows(1, 2)) == [2]
+    reopened = AppendOnlyStore(str(tmp_path / "memory"), DIM)
+    assert reopened.count == 3
+    assert reopened.read_texts() == ["one", "twö", "three"]
+    np.testing.assert_array_equal(reopened.read_embeddings(), rows(3))
+    np.testing.assert_array_equal(reopened.read_rows(np.array([2, 0])), rows(3)[[2, 0]])
+
+def test_write_without_index_entry_is_discarded(tmp_path):
+    base = str(tmp_path / "memory")
+    store = AppendOnlyStore(base, DIM)
+    store.append(["kept"], rows(1))
+    # A crash after the text and embedding were written but before the index entry that commits them
+    with open(f"{base}.txt", "ab") as f:
+        f.write(b"lost")
+    with open(f"{base}.emb", "ab") as f:
+        f.write(rows(1, 1).tobytes())
+    with open(f"{base}.idx", "ab") as f:
+        f.write(b"\0" * (INDEX_ENTRY_SIZE // 2))
+    reopened = AppendOnlyStore(base, DIM)
+    assert reopened.count == 1
+    assert reopened.read_texts() == ["kept"]
+    assert reopened.append(["next"], rows(1, 5)) == [1]
+    assert AppendOnlyStore(base, DIM).read_texts() == ["kept", "next"]
+
+def test_index_entry_past_the_text_is_discarded(tmp_path):
+    base = str(tmp_path / "memory")
+    store = AppendOnlyStore(base, DIM)
+    store.append(["first", "second"], rows(2))
+    with open(f"{base}.txt", "r+b") as f:
+        f.truncate(len("first") + 2)  # The second text was cut short
+    reopened = AppendOnlyStore(base, DIM)
+    assert reopened.count == 1
+    assert reopened.read_texts() == ["first"]
+    assert reopened.read_embeddings().shape == (1, DIM)
+
+def test_tombstones_persist_and_partial_entries_are_dropped(tmp_path):
+    base = str(tmp_path / "memory")
+    store = AppendOnlyStore(base, DIM)
+    store.append(["a", "b", "c"], rows(3))
+    store.delete([1])
+    store.delete([2])
+    with open(f"{base}.tomb", "ab") as f:
+        f.write(b"\1\0\0")  # A torn tombstone write
+    reopened = AppendOnlyStore(base, DIM)
+    assert reopened.read_tombstones().tolist() == [1, 2]
+    assert reopened.read_texts() == ["a", "b", "c"]  # Deleted records stay in place
+
+def test_clear_empties_every_file(tmp_path):
+    base = str(tmp_path / "memory")
+    store = AppendOnlyStore(base, DIM)
+    store.append(["a"], rows(1))
+    store.delete([0])
+    store.clear()
+    reopened = AppendOnlyStore(base, DIM)
+    assert reopened.count == 0
+    assert reopened.read_texts() == []
+    assert len(reopened.read_tombstones()) == 0
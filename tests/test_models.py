@@ -0,0 +1,34 @@
+# `.\tests\test_models.py` - Detecting the end of streamed command JSON and reading the commands in it.
+
+# Imports
+import json
+from scripts.models import JsonHandler, JsonStreamScanner
+
+def scan(tokens):
+    """The reply as the stream loop keeps it: tokens up to the one closing the object, cut after the brace."""
+    scanner, parts = JsonStreamScanner(), []
+    for token in tokens:
+        end = scanner.feed(token)
+        parts.append(token[:end] if end >= 0 else token)
+        if end >= 0:
+            return "".join(parts), True
+    return "".join(parts), False
+
+def test_scanner_stops_at_the_closing_brace():
+    reply = {"thoughts": {"text": "a } in a string", "plan": "- \"quoted {\" \\\\"}, "commands": [{"name": "do_nothing", "args": {}}]}
+    text = json.dumps(reply)
+    for size in (1, 2, 7, len(text)):
+        tokens = [text[i:i + size] for i in range(0, len(text), size)] + [" trailing {\"x\": 1}"]
+        assert scan(tokens) == (text, True)
+
+def test_scanner_ignores_braces_before_the_object_and_in_strings():
+    assert scan(["Sure } here: ", '{"a": "}}"', ', "b": {"c": "\\"}"}', "}", " done"]) == ('Sure } here: {"a": "}}", "b": {"c": "\\"}"}}', True)
+    assert scan(['{"a": [1, 2', ']']) == ('{"a": [1, 2]', False)
+
+def test_get_commands_reads_a_list_or_a_single_command():
+    several = json.dumps({"commands": [{"name": "read_file", "args": {"file": "a"}}, {"name": "web_search", "args": {"query": "q"}}]})
+    assert JsonHandler.get_commands(several) == [("read_file", {"file": "a"}), ("web_search", {"query": "q"})]
+    single = json.dumps({"command": {"name": "do_nothing"}})
+    assert JsonHandler.get_commands(single) == [("do_nothing", {})]
+    assert JsonHandler.get_commands(json.dumps({"thoughts": {}}))[0][0] == "Error"
+    assert JsonHandler.get_commands(json.dumps({"commands": ["oops"]}))[0][0] == "Error"
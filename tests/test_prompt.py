@@ -0,0 +1,54 @@
+# `.\tests\test_prompt.py` - Context assembly within the token budget.
+
+# Imports
+from scripts.models import count_message_tokens
+from scripts.prompt import MEMORY_TOKEN_BUDGET, RESPONSE_TOKEN_RESERVE, HistoryTokenIndex, build_context, create_chat_message, select_within_budget
+
+def make_history(count):
+    return [create_chat_message("user" if i % 2 else "assistant", f"step {i}: the agent reads files and writes code " * (1 + i % 4))
+            for i in range(count)]
+
+def test_select_within_budget_keeps_the_longest_prefix():
+    assert select_within_budget([3, 4, 5], 7) == (2, 7)
+    assert select_within_budget([3, 4, 5], 6) == (1, 3)
+    assert select_within_budget([8], 7) == (0, 0)
+    assert select_within_budget([], 7) == (0, 0)
+
+def test_history_index_finds_the_newest_suffix():
+    index = HistoryTokenIndex(count_fn=lambda messages: [len(message["content"]) for message in messages])
+    history = [create_chat_message("user", "x" * n) for n in (5, 3, 4, 2)]
+    index.update(history)
+    assert index.newest_within(6) == (2, 6)
+    assert index.newest_within(5) == (3, 2)
+    history.append(create_chat_message("user", "x"))
+    index.update(history)  # Only the new message is counted
+    assert index.newest_within(3) == (3, 3)
+    assert index.newest_within(100) == (0, 15)
+
+def test_context_fits_the_token_limit(stand_in_model):
+    history = make_history(400)
+    memory = [f"memory {i}: notes summary result " * 20 for i in range(50)]
+    token_limit = 4000
+    context, budget = build_context("You are the agent.", memory, history, "Determine the next command.", token_limit)
+    assert count_message_tokens(context) <= token_limit - RESPONSE_TOKEN_RESERVE
+    assert budget["system"] + budget["memory"] + budget["history"] + budget["user"] + budget["reply"] == token_limit
+    assert budget["reply"] >= RESPONSE_TOKEN_RESERVE
+    # The newest messages are kept, in order, and the user input comes last
+    kept = budget["history_messages"]
+    assert 0 < kept < len(history)
+    assert context[3:-1] == history[-kept:]
+    assert context[-1] == create_chat_message("user", "Determine the next command.")
+    # Memory is kept most relevant first, within its own budget
+    memory_message = context[2]["content"]
+    num_memories = budget["memory_items"]
+    assert 0 < num_memories < len(memory)
+    assert all(memory[i] in memory_message for i in range(num_memories))
+    assert memory[num_memories] not in memory_message
+    assert budget["system"] + budget["memory"] <= MEMORY_TOKEN_BUDGET
+
+def test_context_keeps_everything_that_fits(stand_in_model):
+    history = make_history(6)
+    context, budget = build_context("You are the agent.", ["one memory"], history, "Go on.", 8000)
+    assert context[3:-1] == history
+    assert budget["history_messages"] == len(history)
+    assert budget["memory_items"] == 1
@@ -0,0 +1,81 @@
+# `.\tests\test_tokenizer.py` - GGUF vocabulary reading, BPE merging and memoized token counts.
+
+# Imports
+import collections
+import random
+from scripts.standin import STAND_IN_WORDS
+from scripts.tokenizer import PRETOKENIZE, GGUFTokenizer, TokenCounter, bytes_to_unicode
+
+def train_merges(words, num_merges):
+    """Merges learned the usual way, most frequent pair first, so every merge's parts exist before it."""
+    byte_encoder = bytes_to_unicode()
+    corpus = [[byte_encoder[b] for b in word.encode("utf-8")] for word in words]
+    merges = []
+    for _ in range(num_merges):
+        pairs = collections.Counter(pair for parts in corpus for pair in zip(parts, parts[1:]))
+        if not pairs:
+            break
+        best = max(pairs, key=lambda pair: (pairs[pair], pair))
+        merges.append(" ".join(best))
+        for parts in corpus:
+            i = 0
+            while i < len(parts) - 1:
+                if (parts[i], parts[i + 1]) == best:
+                    parts[i:i + 2] = [parts[i] + parts[i + 1]]
+                i += 1
+    return merges
+
+def reference_bpe(tokenizer, word):
+    """The quadratic GPT-2 loop: merge every occurrence of the lowest ranked pair, then rescan."""
+    parts = [tokenizer.byte_encoder[b] for b in word.encode("utf-8")]
+    while len(parts) > 1:
+        best = min(zip(parts, parts[1:]), key=lambda pair: tokenizer.ranks.get(pair, float("inf")))
+        if best not in tokenizer.ranks:
+            break
+        merged, i = [], 0
+        while i < len(parts):
+            if i < len(parts) - 1 and (parts[i], parts[i + 1]) == best:
+                merged.append(parts[i] + parts[i + 1])
+                i += 2
+            else:
+                merged.append(parts[i])
+                i += 1
+        parts = merged
+    return parts
+
+def make_tokenizer(words, num_merges=300):
+    merges = train_merges(words, num_merges)
+    byte_encoder = bytes_to_unicode()
+    tokens = [byte_encoder[b] for b in range(256)] + ["".join(merge.split(" ")) for merge in merges]
+    return GGUFTokenizer(tokens, merges)
+
+def test_bpe_matches_reference_merging():
+    rng = random.Random(0)
+    alphabet = "aabbbcdeé "
+    words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40))) for _ in range(500)]
+    tokenizer = make_tokenizer(words)
+    for word in words + ["".join(rng.choice(alphabet) for _ in range(400)) for _ in range(20)]:
+        assert tokenizer._bpe(word) == reference_bpe(tokenizer, word), word
+
+def test_bpe_parts_spell_the_word():
+    tokenizer = make_tokenizer(STAND_IN_WORDS)
+    for word in STAND_IN_WORDS + ["unseen", "ßtrange", "ab" * 1000]:
+        assert "".join(tokenizer._bpe(word)) == "".join(tokenizer.byte_encoder[b] for b in word.encode("utf-8"))
+
+def test_numbers_split_into_groups_of_three_digits():
+    assert PRETOKENIZE.findall("12345678") == ["123", "456", "78"]
+    assert PRETOKENIZE.findall("id 42, x7") == ["id", " ", "42", ",", " x", "7"]
+
+def test_pretokenizer_keeps_every_character():
+    text = "def f(x):\n    return x**2  # 1000000\r\n\tüñï 😀"
+    assert "".join(PRETOKENIZE.findall(text)) == text
+
+def test_counter_reads_gguf_vocabulary(stand_in_model):
+    counter = TokenCounter(stand_in_model)
+    assert isinstance(counter.encoder, GGUFTokenizer)
+    assert counter.count("agent") == 1  # Spelled out by the stand-in merges
+    text = "the agent writes code and runs tests"
+    assert counter.count(text) == len(counter.encoder.encode(text)) < len(text)
+    assert len(counter.counts) == 2
+    assert counter.count_many([text, "agent"]) == [counter.count(text), 1]
+    assert len(counter.counts) == 2  # Repeated texts are served from the memo